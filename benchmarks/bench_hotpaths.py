@@ -0,0 +1,158 @@
+'''
+Measures the hot paths of plotarray on synthetic data.
+
+Covers save_plot_data, retrieve_plot_data (eager, lazy and from a column
+directory), list_stats, the lognormal fits and make_plot_array for every
+panel type and output format.  Prints one JSON object per case with the median and minimum time
+in seconds, and optionally writes all of them to a file that later runs
+can be compared with::
+
+    python benchmarks/bench_hotpaths.py --size small --output baseline.json
+    python benchmarks/bench_hotpaths.py --size small --baseline baseline.json
+
+With --baseline the exit status is 1 if any case got slower than
+--threshold times its baseline median.
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+
+import generators
+
+# Data sizes of each preset: total points for I/O and statistics, number of
+# series, points per rendered panel, and the side of the hinton matrix.
+SIZES = dict(small=dict(points=[10**3, 10**5], series=[10], render_points=[10**3, 10**5], matrix=[100]),
+             medium=dict(points=[10**3, 10**6], series=[10, 100], render_points=[10**5, 10**6], matrix=[100, 1000]),
+             large=dict(points=[10**6, 10**8], series=[100, 1000], render_points=[10**6, 10**7], matrix=[1000, 10**4]))
+
+FORMATS = ['png', 'pdf', 'svg']
+
+PANEL_TYPES = ['scatter', 'histogram', 'density', 'hinton']
+
+
+def measure(function, repeat, warmup):
+    # The warm up runs are not timed, so lazy imports and caches are not counted.
+    for _ in range(warmup):
+        function()
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    return statistics.median(seconds), min(seconds)
+
+def cases(size, directory):
+    '''Yields (name, parameters, function) for every benchmark of a size preset.'''
+    from plotarray import save_plot_data, retrieve_plot_data, make_plot_array
+    from plotarray.stats import list_stats, fit_lognormal_to_histogram, fit_lognormal_to_histograms
+
+    sizes = SIZES[size]
+
+    for N_points in sizes['points']:
+        values = generators.scatter_data(N_points)['S0']['x']
+        yield 'list_stats', dict(points=N_points), lambda: list_stats(values)
+        yield 'list_stats_sketch', dict(points=N_points), lambda: list_stats(values, relative_accuracy=0.01)
+
+        for N_series in sizes['series']:
+            plot_data = generators.scatter_data(N_points, N_series)
+            filename = os.path.join(directory, 'bench_{}_{}.h5'.format(N_points, N_series))
+            parameters = dict(points=N_points, series=N_series)
+            yield 'save_plot_data', parameters, lambda: save_plot_data(plot_data, filename)
+
+            # Written here as well, so the retrieve cases also run when --filter skips the save case.
+            save_plot_data(plot_data, filename)
+            yield 'retrieve_plot_data', parameters, lambda: retrieve_plot_data(filename, verbose=False)
+
+            def lazy_read():
+                with retrieve_plot_data(filename, verbose=False, lazy=True) as lazy_data:
+                    for series in lazy_data.values():
+                        series['x'][:1000]
+            yield 'retrieve_plot_data_lazy', parameters, lazy_read
+
+            directory_name = os.path.join(directory, 'bench_{}_{}.columns'.format(N_points, N_series))
+            save_plot_data(plot_data, directory_name, backend='columns')
+            def mapped_read():
+                with retrieve_plot_data(directory_name, verbose=False) as mapped_data:
+                    for series in mapped_data.values():
+                        series['x'][:1000].sum()
+            yield 'retrieve_plot_data_columns', parameters, mapped_read
+
+    for N_series in sizes['series']:
+        hists, bin_edges = generators.histograms(N_series)
+        def single_fits():
+            for hist, edges in zip(hists, bin_edges):
+                fit_lognormal_to_histogram(hist, edges)
+        yield 'fit_lognormal_to_histogram', dict(series=N_series), single_fits
+        yield 'fit_lognormal_to_histograms', dict(series=N_series), lambda: fit_lognormal_to_histograms(hists, bin_edges)
+
+    for plot_type in PANEL_TYPES:
+        data_sizes = sizes['matrix'] if plot_type == 'hinton' else sizes['render_points']
+        for data_size in data_sizes:
+            if plot_type == 'hinton':
+                plot_data = generators.matrix_data(data_size)
+            else:
+                plot_data = generators.scatter_data(data_size)
+            plot_info = generators.plot_info(plot_type)
+            for format in FORMATS:
+                filename = os.path.join(directory, 'bench.{}'.format(format))
+                parameters = dict(type=plot_type, size=data_size, format=format)
+                yield 'make_plot_array', parameters, lambda: make_plot_array(plot_data, plot_info, filename)
+
+def case_key(result):
+    return json.dumps([result['case'], result['parameters']], sort_keys=True)
+
+def compare(results, baseline, threshold):
+    '''Returns the results that are more than threshold times slower than in baseline.'''
+    baseline = {case_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        previous = baseline.get(case_key(result))
+        if previous and result['seconds_median'] > threshold * previous['seconds_median']:
+            regressions.append(dict(result, baseline_median=previous['seconds_median'],
+                                    ratio=round(result['seconds_median'] / previous['seconds_median'], 2)))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', choices=sorted(SIZES), default='small', help='Data size preset.')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs per case.')
+    parser.add_argument('--warmup', type=int, default=1, help='Number of untimed runs per case.')
+    parser.add_argument('--filter', default='', help='Only run cases whose name contains this text.')
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    parser.add_argument('--baseline', help='Compare with the results in this JSON file.')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='Report cases slower than this times their baseline.')
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for name, parameters, function in cases(args.size, directory):
+            if args.filter not in name:
+                continue
+            median, minimum = measure(function, args.repeat, args.warmup)
+            result = dict(benchmark='hotpaths', case=name, parameters=parameters,
+                          seconds_median=round(median, 6), seconds_min=round(minimum, 6))
+            results.append(result)
+            print(json.dumps(result))
+            sys.stdout.flush()
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+        for regression in regressions:
+            print(json.dumps(dict(regression, benchmark='regression')))
+        return 1 if regressions else 0
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
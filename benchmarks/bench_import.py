@@ -0,0 +1,55 @@
+'''
+Measures the start up cost of plotarray.
+
+Every case runs in a fresh interpreter, so the numbers include the imports
+it triggers.  Prints one JSON object per case with the median time in
+milliseconds and the heavy libraries that were imported::
+
+    python benchmarks/bench_import.py --repeat 10
+'''
+
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+CASES = [('import plotarray', 'import plotarray'),
+         ('colour_dic', 'import plotarray; plotarray.colour_dic'),
+         ('list_stats', 'from plotarray.stats import list_stats; list_stats([1.0, 2.0])'),
+         ('save_plot_data', 'import plotarray; plotarray.save_plot_data'),
+         ('make_plot_array', 'import plotarray; plotarray.make_plot_array; plotarray.core.plt.figure'),
+         ]
+
+HEAVY_MODULES = ['numpy', 'scipy', 'h5py', 'matplotlib']
+
+TEMPLATE = '''
+import sys, time, json
+start = time.perf_counter()
+{statement}
+seconds = time.perf_counter() - start
+print(json.dumps(dict(seconds=seconds, modules=[m for m in {modules!r} if m in sys.modules])))
+'''
+
+def run_case(statement, repeat):
+    seconds, modules = [], []
+    for _ in range(repeat):
+        code = TEMPLATE.format(statement=statement, modules=HEAVY_MODULES)
+        output = subprocess.check_output([sys.executable, '-c', code])
+        result = json.loads(output.decode().strip().splitlines()[-1])
+        seconds.append(result['seconds'])
+        modules = result['modules']
+    return statistics.median(seconds) * 1000, modules
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help='Number of fresh interpreters per case.')
+    args = parser.parse_args(argv)
+
+    for name, statement in CASES:
+        milliseconds, modules = run_case(statement, args.repeat)
+        print(json.dumps(dict(benchmark='import', case=name, milliseconds=round(milliseconds, 2),
+                              modules=modules)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+'''
+Synthetic plot_data for the benchmarks.
+
+Every generator takes a seed, so repeated runs (and the baseline run they are
+compared with) draw the same data.
+'''
+
+import numpy
+
+
+def scatter_data(N_points, N_series=1, seed=0):
+    '''N_points x/y values in total, split evenly over N_series series.'''
+    random_state = numpy.random.RandomState(seed)
+    per_series = max(1, N_points // N_series)
+    return {'S{}'.format(index): dict(x=random_state.lognormal(0, 0.75, per_series),
+                                      y=random_state.randn(per_series))
+            for index in range(N_series)}
+
+def histograms(N_series, N_bins=50, N_points=10000, seed=0):
+    '''Counts and bin edges of N_series lognormal samples with random parameters.'''
+    random_state = numpy.random.RandomState(seed)
+    hists, bin_edges = [], []
+    for _ in range(N_series):
+        values = random_state.lognormal(random_state.uniform(-1, 2), random_state.uniform(0.2, 1.2), N_points)
+        hist, edges = numpy.histogram(values, N_bins)
+        hists.append(hist)
+        bin_edges.append(edges)
+    return hists, bin_edges
+
+def matrix_data(size, seed=0):
+    '''One series holding a size x size matrix of signed weights.'''
+    random_state = numpy.random.RandomState(seed)
+    return dict(M=dict(matrix=random_state.randn(size, size)))
+
+def plot_info(plot_type, N_series=1, **options):
+    '''A one panel plot_info of plot_type showing the first N_series series.'''
+    series_key = 'M' if plot_type == 'hinton' else None
+    series = {series_key or 'S{}'.format(index): 'blue' for index in range(N_series)}
+    panel = dict(mpl=dict(title=plot_type), series=series, type=plot_type)
+    panel.update(options)
+    return {'shape': (1, 1), 'figsize': (6, 4), 'title': plot_type, ((0, 0), 1, 1): panel}
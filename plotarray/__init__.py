@@ -8,12 +8,46 @@ colour_name_cycle : itertools.cycle
 
 colour_dic : collections.OrderedDict
     A dictionary of colour names.
+
+Every attribute is imported from its module the first time it is used, so
+``import plotarray`` does not import matplotlib, scipy or h5py.
 """
 
-from . core import retrieve_plot_data, save_plot_data, make_plot_array
-from . structures import colour_name_cycle, colour_dic, colours
-from . external import make_colour_map
+import importlib
+
+# Attribute name: the plotarray module that defines it.
+_attribute_modules = dict(retrieve_plot_data='core',
+                          retrieve_plot_data_files='core',
+                          save_plot_data='core',
+                          append_plot_data='core',
+                          make_plot_array='core',
+                          render_plot_array='core',
+                          make_plot_pages='core',
+                          clear_figure_templates='core',
+                          PlotData='data',
+                          PlotDataWriter='hdf5',
+                          MappedPlotData='columnar',
+                          PanelCache='cache',
+                          RenderReport='report',
+                          compile_plot_info='plan',
+                          render_batch='batch',
+                          colours='structures',
+                          colour_name_cycle='structures',
+                          colour_dic='structures',
+                          make_colour_map='external')
+
+__all__ = ['retrieve_plot_data', 'retrieve_plot_data_files', 'save_plot_data', 'append_plot_data',
+           'PlotData', 'PlotDataWriter', 'MappedPlotData', 'PanelCache', 'RenderReport', 'make_plot_array',
+           'render_plot_array', 'make_plot_pages', 'clear_figure_templates', 'compile_plot_info',
+           'render_batch', 'colours', 'colour_name_cycle', 'colour_dic', 'make_colour_map']
 
-__all__ = ['retrieve_plot_data', 'save_plot_data', 'make_plot_array', 'colours',
-           'colour_name_cycle', 'colour_dic', 'make_colour_map']
+def __getattr__(name):
+    if name in _attribute_modules:
+        module = importlib.import_module('.' + _attribute_modules[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
 
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
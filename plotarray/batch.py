@@ -0,0 +1,130 @@
+'''
+Module that renders many plot arrays in parallel.
+'''
+
+__all__ = ['render_batch']
+
+from . external import *
+mylog = LazyLogger(__name__)
+
+from . structures import RenderResult
+from . core import retrieve_plot_data, make_plot_array
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def _init_worker():
+    '''Runs once in every worker process, before its first job.'''
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    plt.ioff()
+    # The dependencies are imported lazily; importing them here keeps the import
+    # time out of the first job of every (new or replaced) worker.
+    for module in (mpl_collections, mpl_backend_pdf, h5py, scipy_special):
+        module.__name__
+    mylog.debug('Render worker {} ready'.format(os.getpid()))
+
+
+def _peak_memory():
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _render_job(index, plot_data, plot_info, filename):
+    start = time.time()
+    try:
+        if isinstance(plot_data, str):
+            lazy_plot_data = retrieve_plot_data(plot_data, verbose=False, lazy=True)
+            if lazy_plot_data is None:
+                raise FileNotFoundError('Cannot render {}: {} does not exist.'.format(filename, plot_data))
+            with lazy_plot_data:
+                make_plot_array(lazy_plot_data, plot_info, filename)
+        else:
+            make_plot_array(plot_data, plot_info, filename)
+    except Exception:
+        plt.close('all')
+        return RenderResult(index, filename, traceback.format_exc(), time.time() - start, _peak_memory())
+
+    return RenderResult(index, filename, None, time.time() - start, _peak_memory())
+
+
+def _job_size(plot_data):
+    '''Estimates the memory needed to hold plot_data in bytes.'''
+    if isinstance(plot_data, str):
+        return 0
+    return sum(numpy.asarray(data_list).nbytes
+               for series_dic in plot_data.values() for data_list in series_dic.values())
+
+
+@log_with(mylog)
+def render_batch(jobs, processes=None, max_memory=None, max_jobs_per_worker=None, callback=None):
+    '''
+    Renders many plot arrays across a pool of worker processes.
+
+    |  Every job is a (plot_data, plot_info, filename) tuple and is rendered with
+    |  :func:`plotarray.make_plot_array`.  plot_data can also be the filename of an
+    |  HDF5 file, which the worker then opens with :func:`plotarray.retrieve_plot_data`
+    |  (lazy=True) so the data is never copied between processes.  plot_info has to be
+    |  picklable, so functions in it must be defined at module level.
+
+    |  At most two jobs per worker are queued at any time, and with max_memory set a job
+    |  is only submitted when the estimated size of the plot_data of all queued jobs stays
+    |  below it, so the peak memory use does not grow with the number of jobs.
+
+    :param jobs: An iterable of (plot_data, plot_info, filename) tuples.
+    :param processes: The number of worker processes (default: the number of CPUs).
+    :type processes: :py:obj:`int`
+    :param max_memory: The maximum estimated number of plot_data bytes in flight.
+    :type max_memory: :py:obj:`int`
+    :param max_jobs_per_worker: Replace each worker after this many jobs to release the memory it holds.
+    :type max_jobs_per_worker: :py:obj:`int`
+    :param callback: Called with each :class:`RenderResult` as soon as its job finishes.
+    :returns: :py:obj:`list` of RenderResult(index, filename, error, seconds, peak_memory) in job order. |br|
+              error is :py:obj:`None` or the formatted traceback of the failed job.
+    '''
+    processes = processes or multiprocessing.cpu_count()
+    max_in_flight = 2 * processes
+
+    results = {}
+    in_flight = dict(jobs=0, bytes=0)
+    condition = threading.Condition()
+
+    def finish(index, filename, job_bytes, result):
+        if not isinstance(result, RenderResult):
+            error = ''.join(traceback.format_exception_only(type(result), result))
+            result = RenderResult(index, filename, error, None, None)
+        if result.error:
+            mylog.info('Rendering {} failed: {}'.format(filename, result.error))
+        with condition:
+            results[index] = result
+            in_flight['jobs'] -= 1
+            in_flight['bytes'] -= job_bytes
+            condition.notify()
+        if callback:
+            callback(result)
+
+    pool = multiprocessing.Pool(processes, initializer=_init_worker, maxtasksperchild=max_jobs_per_worker)
+    try:
+        for index, (plot_data, plot_info, filename) in enumerate(jobs):
+            job_bytes = _job_size(plot_data)
+            with condition:
+                while in_flight['jobs'] and (in_flight['jobs'] >= max_in_flight or
+                                             (max_memory and in_flight['bytes'] + job_bytes > max_memory)):
+                    condition.wait()
+                in_flight['jobs'] += 1
+                in_flight['bytes'] += job_bytes
+
+            done = functools.partial(finish, index, filename, job_bytes)
+            pool.apply_async(_render_job, (index, plot_data, plot_info, filename),
+                             callback=done, error_callback=done)
+        pool.close()
+        pool.join()
+    finally:
+        pool.terminate()
+
+    mylog.info('Rendered {} plot arrays with {} processes'.format(len(results), processes))
+    return [results[index] for index in sorted(results)]
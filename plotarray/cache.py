@@ -0,0 +1,161 @@
+'''
+Module that holds the on-disk cache of rendered panels.
+'''
+
+__all__ = ['PanelCache', 'panel_digest', 'function_key']
+
+import hashlib
+
+from . external import *
+mylog = LazyLogger(__name__)
+
+from . hdf5 import iter_chunks, CHECKSUM_ATTRIBUTE
+
+# Part of every panel key, so rasters of older versions of the drawing code are not reused.
+PANEL_CACHE_VERSION = 1
+
+
+def function_key(function):
+    '''
+    Returns 'module.name' of a function, or None if it has no name that stays the
+    same between runs and processes (e.g. a lambda or a nested function).
+    '''
+    module = getattr(function, '__module__', None)
+    name = getattr(function, '__qualname__', None) or getattr(function, '__name__', None)
+    if not module or not name or '<' in name:
+        return None
+    return '{}.{}'.format(module, name)
+
+def _stable_value(value):
+    # Replaces the functions in (nested) settings by their names.
+    if isinstance(value, Mapping):
+        return tuple((key, _stable_value(item)) for key, item in value.items())
+    if isinstance(value, (tuple, list)):
+        return tuple(_stable_value(item) for item in value)
+    if callable(value) and function_key(value):
+        return function_key(value)
+    return value
+
+def _update_digest(digest, value):
+    if is_h5py_dataset(value):
+        digest.update(repr((value.dtype.str, value.shape)).encode())
+        # Datasets written by plotarray are identified by their checksum without reading
+        # them; the others are read chunk by chunk.
+        if CHECKSUM_ATTRIBUTE in value.attrs:
+            digest.update(str(value.attrs[CHECKSUM_ATTRIBUTE]).encode())
+        elif value.ndim == 0:
+            digest.update(numpy.ascontiguousarray(value[()]).data)
+        else:
+            for chunk in iter_chunks(value):
+                digest.update(numpy.ascontiguousarray(chunk).data)
+        return
+
+    array = numpy.asarray(value)
+    if array.dtype.kind == 'O':
+        digest.update(repr(value).encode())
+        return
+    digest.update(repr((array.dtype.str, array.shape)).encode())
+    digest.update(numpy.ascontiguousarray(array).data)
+
+def panel_digest(axis, plot_data, size, dpi):
+    '''
+    Returns the cache key of one panel: a hex digest of its compiled settings, its
+    size in pixels and the data of every series it shows (for HDF5 datasets with a
+    checksum attribute, the checksum).  Functions in the settings
+    are keyed by name; with a function (or other value) that has no stable key, such
+    as a lambda, None is returned and the panel is not cached.
+
+    :param axis: The compiled subplot (plan.axes[ax_key]).
+    :type axis: :py:obj:`AxisPlan`
+    :param plot_data: The plot_data the panel is drawn from.
+    :param size: (width, height) of the panel in pixels.
+    :param dpi: The resolution the panel is drawn at.
+    '''
+    settings = repr(_stable_value((PANEL_CACHE_VERSION, axis.type, axis.defaults, axis.lines, axis.xticklabels,
+                                   axis.xticklabel_rotation, axis.mpl, tuple(size), dpi)))
+    # The default repr of an object (and of a lambda) holds its memory address.
+    if ' at 0x' in settings:
+        return None
+
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(settings.encode())
+
+    for plot_series in axis.defaults:
+        digest.update(repr(plot_series).encode())
+        if plot_series not in plot_data:
+            digest.update(b'<missing>')
+            continue
+        plot_dic = plot_data[plot_series]
+        for data_key in sorted(plot_dic):
+            digest.update(repr(data_key).encode())
+            _update_digest(digest, plot_dic[data_key])
+
+    return digest.hexdigest()
+
+
+class PanelCache(object):
+    '''
+    A directory of rendered panels (RGBA arrays), keyed by :func:`panel_digest`.
+
+    Every panel is stored as one .npy file.  Reading a panel marks it as recently
+    used, and once the files take more than max_bytes the least recently used
+    ones are removed.
+
+    :param directory: The cache directory, created if it does not exist.
+    :type directory: :py:obj:`str`
+    :param max_bytes: The size the cache is trimmed to after each write.
+    :type max_bytes: :py:obj:`int`
+    '''
+
+    def __init__(self, directory, max_bytes=2**30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npy')
+
+    def get(self, key):
+        '''Returns the cached panel for key, or None.'''
+        path = self._path(key)
+        try:
+            rgba = numpy.load(path)
+        except (IOError, ValueError):
+            return None
+        os.utime(path)
+        return rgba
+
+    def put(self, key, rgba):
+        '''Stores a panel under key and evicts the least recently used panels if needed.'''
+        path = self._path(key)
+        # Written under a temporary name, so other processes never read half a file.
+        temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temporary_path, 'wb') as npy_file:
+            numpy.save(npy_file, rgba)
+        os.replace(temporary_path, path)
+        self.evict()
+
+    def evict(self):
+        '''Removes the least recently used panels until the cache fits in max_bytes.'''
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npy'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            mylog.debug('Evicted panel {}'.format(path))
+            total -= size
+
+    def clear(self):
+        '''Removes every cached panel.'''
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npy'):
+                os.remove(entry.path)
@@ -0,0 +1,129 @@
+'''
+Module that holds the memory-mapped storage backend of plotarray.
+
+A plot_data directory holds one raw binary file per dataset and a manifest::
+
+    results.columns/
+        manifest.json
+        0.bin
+        1.bin
+        ...
+
+The files are read as read-only numpy.memmap arrays, so opening a directory
+does not read any data, pages are only loaded when a plot touches them, and
+processes rendering from the same directory share them in the page cache.
+'''
+
+__all__ = ['MappedPlotData', 'save_columns', 'read_columns', 'is_column_directory']
+
+import json
+
+from . external import *
+mylog = LazyLogger(__name__)
+
+from . hdf5 import storage_array
+
+MANIFEST_FILENAME = 'manifest.json'
+MANIFEST_FORMAT = 'plotarray-columns'
+MANIFEST_VERSION = 1
+
+
+def is_column_directory(filename):
+    '''Checks whether filename is a directory written by :func:`save_columns`.'''
+    return os.path.isfile(os.path.join(filename, MANIFEST_FILENAME))
+
+def save_columns(plot_data, directory):
+    '''
+    Writes plot_data to a directory of raw binary columns.
+
+    The manifest is written last (and replaced atomically), so readers never see
+    a partly written directory.  Files of a previous version that are no longer
+    listed are removed.
+
+    :param plot_data: The plot_data dictionary to be saved.
+    :type plot_data: :py:obj:`dict`
+    :param directory: The directory to write, created if needed.
+    :type directory: :py:obj:`str`
+    '''
+    os.makedirs(directory, exist_ok=True)
+    old_files = set(entry.name for entry in os.scandir(directory) if entry.name.endswith('.bin'))
+
+    manifest = dict(format=MANIFEST_FORMAT, version=MANIFEST_VERSION, series=OrderedDict())
+    N_files = 0
+    for series_key, series_dic in plot_data.items():
+        series_manifest = manifest['series'][series_key] = OrderedDict()
+        for data_key, data_list in series_dic.items():
+            d_array = numpy.require(storage_array(data_list), requirements='C')
+            column_file = '{}.bin'.format(N_files)
+            N_files += 1
+
+            # Written under a new name, so memory maps of the previous version stay valid.
+            while column_file in old_files:
+                column_file = '{}.bin'.format(N_files)
+                N_files += 1
+
+            d_array.tofile(os.path.join(directory, column_file))
+            series_manifest[data_key] = dict(file=column_file, dtype=d_array.dtype.str, shape=list(d_array.shape))
+            mylog.debug('Wrote column {}/{} with shape {} to {}'.format(series_key, data_key, d_array.shape, column_file))
+
+    temporary_path = os.path.join(directory, MANIFEST_FILENAME + '.tmp')
+    with open(temporary_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1)
+    os.replace(temporary_path, os.path.join(directory, MANIFEST_FILENAME))
+
+    written = set(column['file'] for series_manifest in manifest['series'].values()
+                  for column in series_manifest.values())
+    for column_file in old_files - written:
+        os.remove(os.path.join(directory, column_file))
+
+def _map_column(directory, column):
+    dtype, shape = numpy.dtype(column['dtype']), tuple(column['shape'])
+    if int(numpy.prod(shape)) == 0:
+        # Empty files cannot be memory mapped.
+        return numpy.empty(shape, dtype)
+    return numpy.memmap(os.path.join(directory, column['file']), dtype=dtype, mode='r', shape=shape)
+
+class MappedPlotData(Mapping):
+    '''
+    Read-only mapping of plot_data backed by a directory written by :func:`save_columns`.
+
+    Every value is a read-only numpy.memmap, which can be used like any other
+    array.  Like :class:`plotarray.hdf5.LazyPlotData` it can be used as a context
+    manager; closing it drops its references to the memory maps.
+    '''
+
+    def __init__(self, directory):
+        self.filename = directory
+        with open(os.path.join(directory, MANIFEST_FILENAME)) as manifest_file:
+            manifest = json.load(manifest_file, object_pairs_hook=OrderedDict)
+        if manifest.get('format') != MANIFEST_FORMAT or manifest.get('version') != MANIFEST_VERSION:
+            raise ValueError('{} is not a plotarray column directory of version {}.'.format(directory, MANIFEST_VERSION))
+
+        self._series = OrderedDict()
+        for series_key, series_manifest in manifest['series'].items():
+            self._series[series_key] = OrderedDict((data_key, _map_column(directory, column))
+                                                   for data_key, column in series_manifest.items())
+
+    def __getitem__(self, series_key):
+        return self._series[series_key]
+
+    def __iter__(self):
+        return iter(self._series)
+
+    def __len__(self):
+        return len(self._series)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        '''Drops the memory maps; arrays still referenced elsewhere stay usable.'''
+        self._series = OrderedDict()
+
+def read_columns(directory):
+    '''Opens a directory written by :func:`save_columns` as a :class:`MappedPlotData`.'''
+    mylog.info('Mapping plot data from: {}'.format(directory))
+    return MappedPlotData(directory)
@@ -1,235 +1,657 @@
 '''
 This module holds the core routines of plotarray.
 '''
-__all__ = ['retrieve_plot_data', 'save_plot_data', 'make_plot_array']
+__all__ = ['retrieve_plot_data', 'retrieve_plot_data_files', 'save_plot_data', 'append_plot_data', 'make_plot_array', 'render_plot_array',
+           'make_plot_pages', 'clear_figure_templates']
 
 from . external import *
-mylog = setup_custom_logger(__name__, logging_directory=logging_directory)
-mylog.debug('Entering {0}'.format(__name__))
-
-from . structures import colours, colour_dic
-from . stats import list_stats, fit_lognormal_to_histogram
+mylog = LazyLogger(__name__, logging_directory=logging_directory)
+
+from . structures import RenderPlan, FrozenDict, MeanSTD
+from . stats import fit_lognormal_to_histogram
+from . hdf5 import LazyPlotData, PlotDataWriter, storage_array, dataset_options
+from . plan import as_render_plan, PLOT_DATA_KEYS
+from . cache import panel_digest, function_key
+from . report import NO_REPORT
+from . data import Series
+from . columnar import save_columns, read_columns, is_column_directory
+from . hdf5 import write_matrix_pyramid, read_matrix_level, iter_chunks, iter_aligned_chunks
+from . hdf5 import derived_result, content_checksum, CHECKSUM_ATTRIBUTE, _is_helper_key
+
+# Plot types that draw plot_dic['matrix'] instead of x/y data.
+_MATRIX_TYPES = ('hinton',)
+
+# Figures kept for reuse by the reuse_figure option, keyed on everything in a plan except its data.
+_figure_templates = OrderedDict()
+FIGURE_TEMPLATE_CACHE_SIZE = 8
 
 @log_with(mylog)
-def retrieve_plot_data(filename, verbose=True):
+def retrieve_plot_data(filename, verbose=True, lazy=False, cache_derived=False, report=None):
     '''
     Used to retrieve plot_data from an HDF5 file.
 
-    :param filename: The HDF5 filename to retrieve the plot_data from.
+    |  With lazy=True the file is kept open and a :class:`plotarray.hdf5.LazyPlotData`
+    |  mapping is returned instead.  Datasets are then only read when a plot uses them,
+    |  and they can be sliced without loading the whole array.  Close it with
+    |  its close method or use it as a context manager.
+
+    |  A directory written by save_plot_data with backend='columns' is always returned
+    |  as a :class:`plotarray.columnar.MappedPlotData` of read-only memory maps, so no
+    |  data is read until it is used.
+
+    |  With cache_derived=True as well, the file is opened for writing and the render
+    |  functions store histogram counts, lognormal fits, medians and trendlines in it
+    |  (see :func:`plotarray.hdf5.derived_result`), so the next render of unchanged
+    |  data reads them instead of computing them again.
+
+    :param filename: The HDF5 filename (or column directory) to retrieve the plot_data from.
     :type filename: :py:obj:`str`
+    :param lazy: Return a mapping backed by the open HDF5 file instead of reading all data.
+    :type lazy: :py:obj:`bool`
+    :param cache_derived: Store derived results in the file (only with lazy=True).
+    :type cache_derived: :py:obj:`bool`
+    :param report: Records a 'load' phase per dataset (not with lazy=True).
+    :type report: :py:obj:`RenderReport`
     :returns: :py:obj:`None` if filename does not exist, otherwise plot_data (:py:obj:`dict`)
     '''
+    if is_column_directory(filename):
+        return read_columns(filename)
+
     if os.path.exists(filename):
         try:
-            h5_file = h5py.File(filename, 'r')
+            h5_file = None
+            if lazy and cache_derived:
+                try:
+                    h5_file = h5py.File(filename, 'r+')
+                except OSError:
+                    mylog.info('Cannot store derived results in read-only file {}'.format(filename))
+            h5_file = h5_file or h5py.File(filename, 'r')
         except OSError as e:
             return None
         except Exception as e:
             raise Exception('Error trying to read {}'.format(filename), e)
 
-        plot_data = defaultdict(dict)
-        for series_key, series_dic in h5_file.items():
-            for data_key, data_list in series_dic.items():
-                if hasattr(data_list, 'value'):
-                    plot_data[series_key][data_key] = data_list.value
-                else:
-                    dl = [v for k, v in data_list.items()]
-                    print(dl, type(dl), data_key)
-
         if verbose:
             mylog.info('Retrieving plot data from: {}'.format(filename))
 
+        if lazy:
+            return LazyPlotData(h5_file)
+
+        report = report or NO_REPORT
+        plot_data = defaultdict(dict)
+        with h5_file:
+            for series_key, series_dic in h5_file.items():
+                for data_key, data_list in series_dic.items():
+                    if isinstance(data_list, h5py.Dataset):
+                        with report.phase('load', series=series_key, points=data_list.size):
+                            plot_data[series_key][data_key] = data_list[()]
+                    elif _is_helper_key(data_key):
+                        continue
+                    else:
+                        dl = [v for k, v in data_list.items()]
+                        print(dl, type(dl), data_key)
+
         return plot_data
         
     return None
 
+def _open_for_reading(filename):
+    # Opens read-only in SWMR mode where the HDF5 library supports it, so files that
+    # are still being appended to (e.g. by a PlotDataWriter) can be read consistently.
+    try:
+        return h5py.File(filename, 'r', swmr=True)
+    except (ValueError, TypeError):
+        return h5py.File(filename, 'r')
+
+def _read_file(filename, wanted):
+    # Reads the series (and data_keys) in wanted, or everything if wanted is None.
+    plot_data = OrderedDict()
+    if is_column_directory(filename):
+        for series_key, series_dic in read_columns(filename).items():
+            if wanted is None or series_key in wanted:
+                plot_data[series_key] = {data_key: column for data_key, column in series_dic.items()
+                                         if wanted is None or data_key in wanted[series_key]}
+        return plot_data
+
+    with _open_for_reading(filename) as h5_file:
+        for series_key, series_group in h5_file.items():
+            if wanted is not None and series_key not in wanted:
+                continue
+            data_keys = wanted[series_key] if wanted is not None else None
+            series_dic = plot_data[series_key] = {}
+            for data_key, dataset in series_group.items():
+                if _is_helper_key(data_key) or not isinstance(dataset, h5py.Dataset):
+                    continue
+                if data_keys is None or data_key in data_keys:
+                    series_dic[data_key] = dataset[()]
+    return plot_data
+
+@log_with(mylog)
+def retrieve_plot_data_files(filenames, plot_info=None, max_workers=8, separator=':', processes=False):
+    '''
+    Used to retrieve the plot_data of several HDF5 files at once and merge it.
+
+    |  The files are read in a pool of max_workers threads, each file opened read-only
+    |  (in SWMR mode where available).  h5py runs one HDF5 library call at a time per
+    |  process, so threads mainly help when files are slow to open or reach (e.g. on a
+    |  network file system).  For compressed files, where decompression dominates,
+    |  processes=True reads them in max_workers processes instead, at the cost of
+    |  sending the arrays back to this process.  Every series is stored under
+    |  '<label><separator><series_key>', where the label of a file is its name without
+    |  directory and extension, or the key it is given under if filenames is a dictionary.
+
+    |  With plot_info only the series it shows, and only the data_keys their plot types
+    |  use, are read.  Its series keys have to be the merged (labelled) ones, e.g.
+    |  {'run_1:control': 'blue', 'run_2:control': 'red'}.  Files that do not exist
+    |  are skipped.
+
+    :param filenames: A list of HDF5 filenames, or a dictionary of label: filename.
+    :type filenames: :py:obj:`list` or :py:obj:`dict`
+    :param plot_info: Only read what this plot_info (or render plan) uses.
+    :type plot_info: :py:obj:`dict` or :py:obj:`RenderPlan`
+    :param max_workers: The maximum number of files read at the same time.
+    :type max_workers: :py:obj:`int`
+    :param separator: The text between the label and the series_key.
+    :type separator: :py:obj:`str`
+    :param processes: Use worker processes instead of threads.
+    :type processes: :py:obj:`bool`
+    :returns: plot_data (:py:obj:`collections.OrderedDict`) in the order of filenames
+    :raises ValueError: if two files have the same label.
+    '''
+    if isinstance(filenames, Mapping):
+        labelled = list(filenames.items())
+    else:
+        labelled = [(os.path.splitext(os.path.basename(filename))[0], filename) for filename in filenames]
+    labels = [label for label, _ in labelled]
+    if len(set(labels)) != len(labels):
+        raise ValueError('Files with the same label cannot be merged.', labels)
+
+    # label: {series_key: data_keys} of everything plot_info shows, or None to read everything.
+    wanted = None
+    if plot_info is not None:
+        plan = as_render_plan(plot_info)
+        wanted = defaultdict(dict)
+        for merged_key, ax_keys in plan.series_axes.items():
+            label, _, series_key = str(merged_key).partition(separator)
+            data_keys = wanted[label].setdefault(series_key, set())
+            for ax_key in ax_keys:
+                data_keys.update(PLOT_DATA_KEYS[plan.axes[ax_key].type])
+
+    jobs = [(label, filename) for label, filename in labelled
+            if (wanted is None or label in wanted) and os.path.exists(filename)]
+    for label, filename in labelled:
+        if not os.path.exists(filename):
+            mylog.info('Skipping {} because it does not exist.'.format(filename))
+
+    mylog.info('Retrieving plot data from {} files'.format(len(jobs)))
+    if processes:
+        Executor = concurrent.futures.ProcessPoolExecutor
+    else:
+        Executor = concurrent.futures.ThreadPoolExecutor
+
+    with Executor(max(1, min(max_workers, len(jobs)))) as executor:
+        futures = [executor.submit(_read_file, filename, None if wanted is None else wanted[label])
+                   for label, filename in jobs]
+
+        plot_data = OrderedDict()
+        for (label, filename), future in zip(jobs, futures):
+            for series_key, series_dic in future.result().items():
+                plot_data['{}{}{}'.format(label, separator, series_key)] = series_dic
+
+    return plot_data
+
 @log_with(mylog)
-def save_plot_data(plot_data, filename):
+def save_plot_data(plot_data, filename, chunks=None, compression=None, compression_opts=None,
+                   shuffle=False, series_options=None, pyramid=False, backend='hdf5'):
     '''
     Used to save plot_data to an HDF5 file.
 
+    |  The chunks, compression, compression_opts and shuffle arguments are passed to
+    |  h5py for every dataset in the file.  series_options can override them for a
+    |  single series (key: series_key) or a single dataset (key: (series_key, data_key)),
+    |  e.g. series_options={'big_series': dict(chunks=(65536,), compression='lzf')}.
+
+    |  With pyramid enabled, every numeric 2-D dataset also gets downsampled levels
+    |  (block max-abs and signed mean, see :func:`plotarray.hdf5.write_matrix_pyramid`)
+    |  so matrix plots of a lazily retrieved file can draw at the resolution of the panel.
+
+    |  Every dataset stores a checksum of its content (see :func:`plotarray.hdf5.content_checksum`),
+    |  so a :class:`plotarray.PanelCache` can tell whether a lazily retrieved series changed
+    |  without reading it.
+
+    |  With backend='columns' filename is a directory of uncompressed binary columns
+    |  (see :mod:`plotarray.columnar`) that :func:`plotarray.retrieve_plot_data` maps
+    |  into memory instead of reading it.  The HDF5 dataset options do not apply to it.
+
     :param plot_data: The plot_data dictionary to be saved.
     :type plot_data: :py:obj:`dict`
     :param filename: The HDF5 filename to save plot_data into.
     :type filename: :py:obj:`str`
+    :param chunks: Chunk shape (fitted to each dataset, see :func:`plotarray.hdf5.fit_chunks`), or True to let h5py choose one.
+    :type chunks: :py:obj:`tuple` or :py:obj:`bool`
+    :param compression: Compression filter: 'gzip', 'lzf' or 'szip'.
+    :type compression: :py:obj:`str`
+    :param compression_opts: Filter options, e.g. the gzip level (0-9).
+    :type compression_opts: :py:obj:`int`
+    :param shuffle: Apply the HDF5 shuffle filter before compression.
+    :type shuffle: :py:obj:`bool`
+    :param series_options: Per series or per dataset h5py dataset options.
+    :type series_options: :py:obj:`dict`
+    :param pyramid: Store pyramid levels for matrices.  An integer sets the size of the coarsest level (default 64).
+    :type pyramid: :py:obj:`bool` or :py:obj:`int`
+    :param backend: 'hdf5' or 'columns'.
+    :type backend: :py:obj:`str`
+    :raises ValueError: for an unknown backend, or HDF5 options with backend='columns'.
     '''
 
-    def get_dtype(item):
-        return_item = item
-        
-        if hasattr(item, '__len__'):
-            data_length = len(item)
-            if any([type(i)  == numpy.ndarray for i in item]):
-                dtype = 'array_of_arrays'
-            elif  any([type(i) == list for i in item]):
-                dtype = 'array_of_arrays'
-                return_item = [numpy.array(i) for i in item]
-            elif any([type(i) in (float, numpy.float64) for i in item]):
-                dtype = 'float64'
-            elif all([type(i) in (int, numpy.int64) for i in item]):
-                dtype = 'int64'
-            elif all([type(i) == str for i in item]):
-                max_length = max([len(i) for i in item])
-                dtype = '|S{}'.format(max_length)
-            else:
-                #print(item, type(item))
-                raise NotImplementedError('This data type has not yet been implemented.', type(item[0]))
-        else:
-            data_length = 1
-            if type(item) in (float, numpy.float64):
-                dtype = 'float64'
-            elif type(item) in (int, numpy.int64):
-                dtype = 'int64'
-            elif type(item) == str:
-                dtype = '|S{}'.format(len(item))
-            else:
-                raise NotImplementedError('This data type has not yet been implemented.', type(item))
-        return dtype, data_length, return_item
-    
     mylog.info('Saving table: {}'.format(filename))
 
-    h5_file = h5py.File(filename, 'w')
-
-    for series_key, series_dic in plot_data.items():
-        series_length = None
-        for data_key, data_list in series_dic.items():
-            if data_key in ['X', 'Y']:
-                if len(data_list) < 1:
-                    msg_tmpl = 'Skipping series {} with data type {} because it has zero length.'
-                    mylog.info(msg_tmpl.format(series_key, data_key))
-                    continue
-                if not series_length:
-                    series_length == len(data_list)
-                elif len(data_list) != series_length:
-                    msg_tmpl = 'Skippping {} with data type {} because its length does not match the series length.'
-                    mylog.info(msg_tmpl.format(series_key, data_key))
-                    continue
+    if backend == 'columns':
+        if compression or chunks or shuffle or series_options or pyramid:
+            raise ValueError('The columns backend stores uncompressed columns without HDF5 options.')
+        save_columns(plot_data, filename)
+        return
+    if backend != 'hdf5':
+        raise ValueError('Unknown backend {!r}.'.format(backend))
 
-            dtype, data_length, d_list = get_dtype(data_list)
+    file_options = dict(chunks=chunks, compression=compression,
+                        compression_opts=compression_opts, shuffle=shuffle)
 
-            h5_key = '{}/{}'.format(series_key, data_key)
-            msg_tmpl = 'Adding data series {} to HDF5 file with {} data points of type {}'
-            
-            if dtype == 'array_of_arrays':
-                mylog.debug(msg_tmpl.format(h5_key, (len(d_list), len(d_list[0])), 'numpy.ndarray'))
-                h5_file.create_dataset(h5_key, data=numpy.array(d_list))
-            else:
-                mylog.debug(msg_tmpl.format(h5_key, data_length, dtype))
-                h5_file.create_dataset(h5_key, data=numpy.array(d_list, dtype=dtype))
+    with h5py.File(filename, 'w') as h5_file:
+        for series_key, series_dic in plot_data.items():
+            series_length = None
+            for data_key, data_list in series_dic.items():
+                if data_key in ['X', 'Y']:
+                    if len(data_list) < 1:
+                        msg_tmpl = 'Skipping series {} with data type {} because it has zero length.'
+                        mylog.info(msg_tmpl.format(series_key, data_key))
+                        continue
+                    if not series_length:
+                        series_length == len(data_list)
+                    elif len(data_list) != series_length:
+                        msg_tmpl = 'Skippping {} with data type {} because its length does not match the series length.'
+                        mylog.info(msg_tmpl.format(series_key, data_key))
+                        continue
+
+                d_array = storage_array(data_list)
+                options = dataset_options(series_key, data_key, d_array, file_options, series_options)
+
+                h5_key = '{}/{}'.format(series_key, data_key)
+                msg_tmpl = 'Adding data series {} to HDF5 file with {} data points of type {} and options {}'
+                mylog.debug(msg_tmpl.format(h5_key, d_array.shape, d_array.dtype, options))
+
+                dataset = h5_file.create_dataset(h5_key, data=d_array, **options)
+                dataset.attrs[CHECKSUM_ATTRIBUTE] = content_checksum(d_array)
+
+                if pyramid and d_array.ndim == 2 and d_array.dtype.kind in 'iuf':
+                    min_size = 64 if pyramid is True else pyramid
+                    level_options = {key: value for key, value in options.items() if key != 'chunks'}
+                    write_matrix_pyramid(h5_file, h5_key, d_array, min_size, **level_options)
 
 @log_with(mylog)
-def _get_figure(plot_info):
+def append_plot_data(plot_data, filename, **options):
+    '''
+    Used to append plot_data to an HDF5 file without rewriting it.
+
+    |  New series are added and existing series written by this function (or by
+    |  :class:`plotarray.hdf5.PlotDataWriter`) are extended.  Every dataset is stored
+    |  chunked and resizable so the file can keep growing.  The keyword options are
+    |  the dataset options of :func:`plotarray.save_plot_data`.
+
+    :param plot_data: The plot_data dictionary to be appended.
+    :type plot_data: :py:obj:`dict`
+    :param filename: The HDF5 filename to append plot_data to.  It is created if needed.
+    :type filename: :py:obj:`str`
+    '''
+    with PlotDataWriter(filename, **options) as writer:
+        writer.update(plot_data)
+
+def _get_figure(plan):
     
-    fig = plt.figure(figsize=plot_info['figsize'])
-    plt.suptitle(plot_info['title'])
+    fig = plt.figure(figsize=plan.figsize, dpi=plan.dpi)
+    fig.suptitle(plan.title)
     
+    gs = mpl_gridspec.GridSpec(plan.shape[0], plan.shape[1], figure=fig)
+
     ax_dic = {}
-    for key, value in plot_info.items():
-        if key in ['shape', 'figsize', 'title', 'topspace']:
-            continue
+    for key in plan.axes:
         loc, colspan, rowspan = key
-        mylog.debug('loc:{} colspan:{} rowspan:{}'.format(loc, colspan, rowspan))
 
-        gs = mpl_gridspec.GridSpec(plot_info['shape'][0], plot_info['shape'][1])
         subplotspec = gs.new_subplotspec(loc, rowspan, colspan)        
-        ax = plt.subplot(subplotspec)
+        ax = fig.add_subplot(subplotspec)
 
         ax_dic[key] = ax
             
     return fig, ax_dic
 
+def _template_key(plan):
+    # Everything about a plan except its data: the layout and each subplot's type and settings.
+    axes = [(key, axis.type, axis.mpl, axis.lines, axis.xticklabels, axis.xticklabel_rotation)
+            for key, axis in plan.axes.items()]
+    return (plan.shape, plan.figsize, plan.dpi, plan.title, plan.topspace, repr(axes))
+
+def _get_figure_template(plan):
+    '''
+    Returns fig, ax_dic and the cached layout (None the first time) of a figure
+    that is reused for every render of the same layout.  The data artists (and any
+    twin or colour bar axes) of the previous render are removed, everything else
+    is kept.
+    '''
+    key = _template_key(plan)
+
+    if key not in _figure_templates:
+        fig, ax_dic = _get_figure(plan)
+        _figure_templates[key] = [fig, ax_dic, None]
+        while len(_figure_templates) > FIGURE_TEMPLATE_CACHE_SIZE:
+            _close_figure(_figure_templates.popitem(last=False)[1][0])
+        return _figure_templates[key]
+
+    _figure_templates.move_to_end(key)
+    fig, ax_dic, layout = _figure_templates[key]
+
+    for ax in fig.axes:
+        if ax not in ax_dic.values():
+            ax.remove()
+
+    for ax in ax_dic.values():
+        for artist in list(ax.lines) + list(ax.collections) + list(ax.patches) + list(ax.images) + list(ax.texts):
+            artist.remove()
+        if ax.get_legend():
+            ax.get_legend().remove()
+        ax.relim()
+        ax.set_autoscale_on(True)
+
+    return fig, ax_dic, layout
+
 @log_with(mylog)
+def clear_figure_templates():
+    '''Closes the figures kept by the reuse_figure option of the render functions.'''
+    while _figure_templates:
+        _close_figure(_figure_templates.popitem()[1][0])
+
+def _decimate_points(X, Y, grid_shape, xlim=None, ylim=None, xscale='linear', yscale='linear'):
+    '''
+    Returns the indices of one point per occupied cell of a grid_shape grid laid
+    over the data (or over xlim/ylim), in their original order.  With about one cell
+    per pixel the drawn points cover the same pixels while isolated points, outliers
+    and the extremes of the series are all kept.  Only opaque markers look the same:
+    with alpha < 1 the overplotted regions lose their density and are drawn lighter.
+    Points outside xlim/ylim and non-finite points are dropped.
+
+    On a 'log' scale the grid is even in log10 of the values, like the pixels of the
+    axes, and the values <= 0 (which are not drawn there) are dropped as well.  The
+    other scales have to be 'linear'.
+    '''
+    width, height = max(1, grid_shape[0]), max(1, grid_shape[1])
+    inside = numpy.isfinite(X) & numpy.isfinite(Y)
+    if xlim:
+        inside &= (X >= xlim[0]) & (X <= xlim[1])
+    if ylim:
+        inside &= (Y >= ylim[0]) & (Y <= ylim[1])
+    if xscale == 'log':
+        inside &= X > 0
+    if yscale == 'log':
+        inside &= Y > 0
+
+    index = numpy.nonzero(inside)[0]
+    if index.size < 1:
+        return index
+
+    def cell(values, limits, scale, N_cells):
+        if scale == 'log':
+            values = numpy.log10(values)
+            limits = numpy.log10(limits) if limits and limits[0] > 0 else None
+        low, high = limits if limits else (values.min(), values.max())
+        return ((values - low) * ((N_cells - 1) / ((high - low) or 1.0))).astype('int64')
+
+    column = cell(X[index], xlim, xscale, width)
+    row = cell(Y[index], ylim, yscale, height)
+
+    first = numpy.unique(row * width + column, return_index=True)[1]
+    return index[numpy.sort(first)]
+
 def _plot_scatter(plot_dic, ax, defaults):
     
-    X, Y = plot_dic['x'], plot_dic['y']
+    X, Y = numpy.asarray(plot_dic['x']), numpy.asarray(plot_dic['y'])
 
     if len(X) != len(Y):
         raise UserWarning('You have supplied data that is not the same shape.', len(X), len(Y), defaults)
+
+    if defaults['decimate'] and not {defaults['xscale'], defaults['yscale']} <= {'linear', 'log'}:
+        mylog.info('{} Not decimating points on {} axes.'.format(defaults['info_key'],
+                                                                (defaults['xscale'], defaults['yscale'])))
+    elif defaults['decimate']:
+        bbox = ax.get_window_extent()
+        cells_per_pixel = 1 if defaults['decimate'] is True else defaults['decimate']
+        grid_shape = (int(bbox.width * cells_per_pixel), int(bbox.height * cells_per_pixel))
+        keep = _decimate_points(X, Y, grid_shape, defaults['xlim'], defaults['ylim'],
+                                defaults['xscale'], defaults['yscale'])
+        if mylog.isEnabledFor(logging.DEBUG):
+            mylog.debug('{} Decimated {} points to {}'.format(defaults['info_key'], len(X), len(keep)))
+        X_drawn, Y_drawn = X[keep], Y[keep]
+    else:
+        X_drawn, Y_drawn = X, Y
     
-    ax.plot(X, Y, marker=defaults['marker'], linestyle='None', label=defaults['legend'],
+    ax.plot(X_drawn, Y_drawn, marker=defaults['marker'], linestyle='None', label=defaults['legend'],
             markersize=defaults['markersize'], markerfacecolor=defaults['colour'], markeredgewidth=0,
-            alpha=defaults['alpha'])
+            alpha=defaults['alpha'], rasterized=defaults['rasterized'])
 
     if defaults['addvline']:
-        ax.axvline(list_stats(X).median, color=defaults['colour'], ls='-')
+        median, = derived_result(plot_dic, 'median', (), ('x',), lambda: (numpy.median(X),))
+        ax.axvline(median, color=defaults['colour'], ls='-')
 
     if defaults['trendline']:
-        X[X == float('-inf')] = 0
-        Y[Y == float('-inf')] = 0
-
-        if defaults['trendline_through_zero']:
-            A = numpy.vstack([X, numpy.zeros(len(X))]).T
-        else:
-            A = numpy.vstack([X, numpy.ones(len(X))]).T
-            
-        slope, intercept = numpy.linalg.lstsq(A, Y)[0]
+        through_zero = defaults['trendline_through_zero']
+        slope, intercept, x_min, x_max = derived_result(plot_dic, 'trendline', (through_zero,), ('x', 'y'),
+                                                        lambda: _fit_trendline(X, Y, through_zero))
         
-        x_fit = numpy.linspace(numpy.min(X), numpy.max(X), 2)
+        x_fit = numpy.linspace(x_min, x_max, 2)
         ax.plot(x_fit, slope*x_fit + intercept, color=defaults['colour'], linestyle=defaults['trendline_style'])
         
     return ax
 
-@log_with(mylog)
+def _fit_trendline(X, Y, through_zero):
+    '''Returns slope, intercept and the x range of the least-squares line through X, Y.'''
+    # Replaces -inf with 0 in new arrays, so the series itself is not modified.
+    X = numpy.where(X == float('-inf'), 0, X)
+    Y = numpy.where(Y == float('-inf'), 0, Y)
+
+    if through_zero:
+        A = numpy.vstack([X, numpy.zeros(len(X))]).T
+    else:
+        A = numpy.vstack([X, numpy.ones(len(X))]).T
+        
+    slope, intercept = numpy.linalg.lstsq(A, Y)[0]
+    return slope, intercept, numpy.min(X), numpy.max(X)
+
 def _plot_hinton(plot_dic, ax, defaults):
 
-    matrix = plot_dic['matrix']
+    # Draw at most one square per pixels_per_cell pixels of the panel.
+    bbox = ax.get_window_extent()
+    max_shape = (int(bbox.width / defaults['pixels_per_cell']), int(bbox.height / defaults['pixels_per_cell']))
+    factor, max_abs, matrix = read_matrix_level(plot_dic, 'matrix', max_shape)
+    shape = plot_dic['matrix'].shape
 
-    if not defaults['max_weight']:
-        max_weight = 2 ** numpy.ceil(numpy.log(numpy.abs(matrix).max()) / numpy.log(2))
+    max_weight = defaults['max_weight']
+    if not max_weight:
+        max_weight = 2 ** numpy.ceil(numpy.log(max_abs.max()) / numpy.log(2))
+    if not max_weight:
+        max_weight = 1.0
 
     ax.patch.set_facecolor('gray')
     ax.set_aspect('equal', 'box')
     ax.xaxis.set_major_locator(plt.NullLocator())
     ax.yaxis.set_major_locator(plt.NullLocator())
 
-    for (x,y), w in numpy.ndenumerate(matrix):
-        color = 'white' if w > 0 else 'black'
-        size = numpy.sqrt(numpy.abs(w))
-        rect = plt.Rectangle([x - size / 2, y - size / 2], size, size,
-                             facecolor=color, edgecolor=color)
-        ax.add_patch(rect)
+    # One square per non-zero cell, centred on (row, column) with an area proportional to |w| / max_weight.
+    # Downsampled cells use the block mean for w and are drawn factor times larger at the centre
+    # of the block they cover; max_weight comes from the block max-abs so the scale does not change.
+    x, y = numpy.nonzero(matrix)
+    weights = matrix[x, y]
+    half_sizes = factor * numpy.sqrt(numpy.minimum(numpy.abs(weights) / max_weight, 1.0)) / 2
+    centres = numpy.stack([x, y], axis=-1) * factor + (factor - 1) / 2.0
+
+    corners = numpy.array([(-1, -1), (1, -1), (1, 1), (-1, 1)])
+    vertices = centres[:, None, :] + half_sizes[:, None, None] * corners[None, :, :]
+
+    colours = numpy.where((weights > 0)[:, None], mpl_colours.to_rgba('white'), mpl_colours.to_rgba('black'))
+
+    collection = mpl_collections.PolyCollection(vertices, facecolors=colours, edgecolors='none')
+    ax.add_collection(collection)
+
+    ax.update_datalim([(-0.5, -0.5), (shape[0] - 0.5, shape[1] - 0.5)])
+    ax.autoscale_view()
 
     return ax
     
-@log_with(mylog)
-def _plot_histogram(plot_dic, ax, defaults):
-                    
-    raw_X = plot_dic['x']
+def _plot_density(plot_dic, ax, defaults):
+
+    xlim, ylim = defaults['xlim'], defaults['ylim']
+    chunks = lambda: iter_aligned_chunks((plot_dic['x'], plot_dic['y']), defaults['chunk_size'])
+
+    # The grid range is taken from xlim/ylim or from a first pass over the finite values.
+    if not (xlim and ylim):
+        lows, highs = numpy.array([numpy.inf, numpy.inf]), numpy.array([-numpy.inf, -numpy.inf])
+        for x, y in chunks():
+            for index, values in enumerate((x, y)):
+                values = values[numpy.isfinite(values)]
+                if values.size:
+                    lows[index], highs[index] = min(lows[index], values.min()), max(highs[index], values.max())
+        if not numpy.isfinite(lows).all():
+            mylog.info('{} No data found.'.format(defaults['info_key']))
+            return ax
+        xlim, ylim = xlim or (lows[0], highs[0]), ylim or (lows[1], highs[1])
+
+    # Widens a range without width like numpy.histogram2d does, so the image has an extent.
+    xlim, ylim = [(low - 0.5, high + 0.5) if low == high else (low, high) for low, high in (xlim, ylim)]
+
+    counts = numpy.zeros(numpy.broadcast_to(defaults['N_bins'], 2), dtype='int64')
+    for x, y in chunks():
+        counts += numpy.histogram2d(x, y, counts.shape, range=(xlim, ylim))[0].astype('int64')
+
+    values = numpy.log10(numpy.maximum(counts, 1)) if defaults['log'] else counts
+    colour_map = make_colour_map(0, max(values.max(), 1), defaults['colour_map'])
+    image = colour_map.to_rgba(values)
+    image[counts == 0, 3] = 0.0
+
+    ax.imshow(image.transpose(1, 0, 2), origin='lower', extent=(xlim[0], xlim[1], ylim[0], ylim[1]),
+              aspect='auto', interpolation='nearest')
 
+    if defaults['colourbar']:
+        colour_map.set_array(values)
+        colourbar = ax.figure.colorbar(colour_map, ax=ax)
+        colourbar.set_label('log10(count)' if defaults['log'] else 'count')
+
+    return ax
+
+def _histogram_parameters(defaults):
+    # The parameters _bin_histogram depends on, or None if defaults['function'] has no
+    # name that stays the same between runs (e.g. a lambda).
+    function = defaults['function']
+    if function:
+        function = function_key(function)
+        if function is None:
+            return None
+    return (defaults['N_bins'], defaults['xlim'], function)
+
+def _bin_histogram(plot_dic, defaults):
+    '''
+    Returns hist, bin_edges, mean, lowest and highest value of a histogram series,
+    or None if no data is left after the xlim filter.
+    '''
+    xlim = defaults['xlim']
+
+    if 'counts' in plot_dic:
+        hist, bin_edges = numpy.asarray(plot_dic['counts']), numpy.asarray(plot_dic['bin_edges'])
+        if xlim:
+            inside = numpy.nonzero((bin_edges[:-1] >= xlim[0]) & (bin_edges[1:] <= xlim[1]))[0]
+            hist, bin_edges = hist[inside], bin_edges[inside[0]:inside[-1] + 2] if inside.size else bin_edges[:1]
+
+        filled = numpy.nonzero(hist)[0]
+        if filled.size < 1:
+            return None
+        bin_centres = (bin_edges[:-1] + bin_edges[1:]) / 2.0
+        return (hist, bin_edges, numpy.average(bin_centres, weights=hist),
+                bin_edges[filled[0]], bin_edges[filled[-1] + 1])
+
+    if is_h5py_dataset(plot_dic['x']):
+        return _bin_histogram_chunks(plot_dic['x'], defaults)
+
+    X = numpy.asarray(plot_dic['x'])
     if defaults['function']:
-        raw_X = defaults['function'](raw_X)
-    
-    if defaults['xlim']:
-        X = []
-        for index, Xvalue in enumerate(raw_X):
-            if Xvalue < defaults['xlim'][0]:
-                continue
-            if Xvalue > defaults['xlim'][1]:
-                continue
-            X.append(Xvalue)
-        if len(X) < 1:
+        X = numpy.asarray(defaults['function'](X))
+    if xlim:
+        X = X[(X >= xlim[0]) & (X <= xlim[1])]
+
+    if X.size < 1:
+        return None
+
+    lowest, highest = X.min(), X.max()
+    hist, bin_edges = numpy.histogram(X, defaults['N_bins'], range=(lowest, highest))
+    return hist, bin_edges, X.mean(), lowest, highest
+
+def _bin_histogram_chunks(dataset, defaults):
+    '''
+    Out-of-core version of _bin_histogram for HDF5 datasets.  The first pass over
+    the chunks finds the range and mean, the second accumulates the counts.
+    defaults['function'] is applied chunk by chunk, so it has to be element-wise.
+    '''
+    xlim = defaults['xlim']
+
+    def values():
+        for chunk in iter_chunks(dataset, defaults['chunk_size']):
+            if defaults['function']:
+                chunk = numpy.asarray(defaults['function'](chunk))
+            if xlim:
+                chunk = chunk[(chunk >= xlim[0]) & (chunk <= xlim[1])]
+            if chunk.size:
+                yield chunk
+
+    N, total, lowest, highest = 0, 0.0, numpy.inf, -numpy.inf
+    for chunk in values():
+        N += chunk.size
+        total += chunk.sum(dtype='float64')
+        lowest, highest = min(lowest, chunk.min()), max(highest, chunk.max())
+
+    if N < 1:
+        return None
+
+    hist, bin_edges = numpy.histogram([], defaults['N_bins'], range=(lowest, highest))
+    for chunk in values():
+        hist += numpy.histogram(chunk, defaults['N_bins'], range=(lowest, highest))[0]
+
+    return hist, bin_edges, total / N, lowest, highest
+
+def _plot_histogram(plot_dic, ax, defaults):
+
+    source_keys = ('counts', 'bin_edges') if 'counts' in plot_dic else ('x',)
+    parameters = _histogram_parameters(defaults)
+    binned = derived_result(plot_dic, 'histogram', parameters, source_keys,
+                            lambda: _bin_histogram(plot_dic, defaults))
+    if binned is None:
+        if defaults['xlim']:
             msg_tmpl = '{} No data found within xlim of ({}, {})'
             mylog.info(msg_tmpl.format(defaults['info_key'], defaults['xlim'][0], defaults['xlim'][1]))
-            return ax
-    else:
-        X = raw_X
-
-    mX = list_stats(X).mean
-        
-    try:
-        hist, bin_edges, patches = ax.hist(X, defaults['N_bins'], color=defaults['colour'], alpha=defaults['alpha'])        
-    except AttributeError as e:
-        mylog.info('{} No data found.'.format(defaults['info_key']))
+        else:
+            mylog.info('{} No data found.'.format(defaults['info_key']))
         return ax
+
+    hist, bin_edges, mX, lowest, highest = binned
+
+    ax.stairs(hist, bin_edges, fill=True, color=defaults['colour'], alpha=defaults['alpha'])
         
-    xmin, xmax = min(X)-mX/2.0, max(X)+mX/2.0 
+    xmin, xmax = lowest-mX/2.0, highest+mX/2.0 
     ax.set_xlim([xmin, xmax])
 
     # Number of bins with data
-    N_bars = sum([1 if value > 0 else 0 for value in hist])
+    N_bars = numpy.count_nonzero(hist)
     
     if defaults.get('lognormal_fit', False) and N_bars > 10:
-        x_pdf, y_pdf, stats_pdf = fit_lognormal_to_histogram(hist=hist, bin_edges=bin_edges)
+        def fit():
+            x_pdf, y_pdf, stats_pdf = fit_lognormal_to_histogram(hist=hist, bin_edges=bin_edges)
+            return x_pdf, y_pdf, numpy.asarray(stats_pdf)
+        x_pdf, y_pdf, stats_pdf = derived_result(plot_dic, 'lognormal_fit', parameters, source_keys, fit)
+        stats_pdf = MeanSTD(*stats_pdf)
 
         mylog.info('{0} Mean:{1.mean} SD:{1.standard_deviation}'.format(defaults['info_key'], stats_pdf))
         
@@ -241,107 +663,359 @@ def _plot_histogram(plot_dic, ax, defaults):
     
     return ax
     
-@log_with(mylog)
-def _get_plot_defaults(ax_key, plot_series, plot_info, filename):
-    info_key = 'Filename:{} plot_series:{}'.format(filename, plot_series)
-    
-    msg_tmpl = 'Processing ax_key:{} plot_series:{} plot_info:{} {}'
-    mylog.debug(msg_tmpl.format(ax_key, plot_series, plot_info[ax_key], info_key))
-    
-    colour_key = plot_info[ax_key]['series'][plot_series]
-    mylog.debug('{} has colour_key: {}'.format(info_key, colour_key))
+# Drawing function of each plot type in plan.PLOT_TYPES.
+_PLOT_FUNCTIONS = dict(scatter=_plot_scatter, histogram=_plot_histogram, hinton=_plot_hinton, density=_plot_density)
+
+def _check_series(plot_dic, plot_type):
+    if plot_type in _MATRIX_TYPES:
+        if numpy.size(plot_dic['matrix']) < 1:
+            return 'it has an empty matrix'
+    elif 'counts' in plot_dic:
+        if len(plot_dic['bin_edges']) != len(plot_dic['counts']) + 1:
+            return 'len(bin_edges) != len(counts) + 1'
+    elif len(plot_dic['x']) < 1:
+        return 'it has zero data points'
+    elif 'y' in PLOT_DATA_KEYS[plot_type] and len(plot_dic['y']) != len(plot_dic['x']):
+        return 'len(y) != len(x)'
+    return None
 
-    defaults = dict(alpha=0.25, markersize=2, marker='o', legend=None, addvline=False, lognormal_fit=False)
-    if plot_info[ax_key]['type'] == 'histogram':
-        defaults['N_bins'] = 50
-        
-    for mpl_key in defaults.keys():
-        value_dic = plot_info[ax_key].get(mpl_key, None)
-        if value_dic:
-            mylog.debug('{} Setting plot parameter {} using value dic: {}'.format(info_key, mpl_key, value_dic))
-            defaults[mpl_key] = value_dic.get(plot_series, defaults[mpl_key])
-
-    defaults['colour'] = colour_dic[colour_key]
-    defaults['plot_series'] = plot_series
-    if plot_info[ax_key]['type'] == 'histogram':
-        defaults['xlim'] = plot_info[ax_key]['mpl'].get('xlim', None)
-        defaults['function'] = plot_info[ax_key].get('function', None)
-
-    if plot_info[ax_key]['type'] == 'scatter':
-        defaults['trendline'] = plot_info[ax_key].get('trendline', {}).get(plot_series, None)
-        defaults['trendline_style'] = plot_info[ax_key].get('trendline_style', {}).get(plot_series, '-')
-        defaults['trendline_through_zero'] = plot_info[ax_key].get('trendline_through_zero', {}).get(plot_series, False)
-        
+def _skip_reason(plot_dic, plot_type):
+    # Why a series cannot be drawn as plot_type, or None.  A Series is checked once
+    # per plot type, as its columns cannot change.
+    if not isinstance(plot_dic, Series):
+        return _check_series(plot_dic, plot_type)
+
+    if plot_type not in plot_dic._skip_reasons:
+        plot_dic._skip_reasons[plot_type] = _check_series(plot_dic, plot_type)
+    return plot_dic._skip_reasons[plot_type]
+
+def _series_points(plot_dic, plot_type):
+    if plot_type in _MATRIX_TYPES:
+        return int(numpy.size(plot_dic['matrix']))
+    if 'counts' in plot_dic:
+        return len(plot_dic['counts'])
+    return len(plot_dic['x'])
+
+def _draw_plot_array(plot_data, plan, filename, reuse_figure=False, report=NO_REPORT):
+    with report.phase('figure'):
+        if reuse_figure:
+            template = _get_figure_template(plan)
+            fig, ax_dic, layout = template
+        else:
+            fig, ax_dic = _get_figure(plan)
+            layout = None
+
+    for plot_series, plot_dic in plot_data.items():
+        for ax_key in plan.series_axes.get(plot_series, ()):
+            plot_type = plan.axes[ax_key].type
+            skip_reason = _skip_reason(plot_dic, plot_type)
+            if skip_reason:
+                mylog.info('Skipping plot_series {} because {}.'.format(plot_series, skip_reason))
+                continue
+
+            defaults = dict(plan.axes[ax_key].defaults[plot_series])
+            defaults['info_key'] = 'Filename:{} plot_series:{}'.format(filename, plot_series)
+
+            with report.phase('draw', ax_key, plot_series, _series_points(plot_dic, plot_type)):
+                ax_dic[ax_key] = _PLOT_FUNCTIONS[plot_type](plot_dic, ax_dic[ax_key], defaults)
+
+    with report.phase('layout'):
+        for ax_key, ax in ax_dic.items():
+            axis = plan.axes[ax_key]
+            for line_method, line_options in axis.lines:
+                getattr(ax, line_method)(**line_options)
+
+            # plt.setp without properties prints the table of all properties.
+            if axis.mpl:
+                plt.setp(ax, **axis.mpl)
+
+            # After plt.setp so the labels are placed on any xticks given in plot_info.
+            if axis.xticklabels:
+                ax.set_xticklabels(axis.xticklabels, rotation=axis.xticklabel_rotation)
+
+        if layout:
+            for ax_key, position in layout.items():
+                ax_dic[ax_key].set_position(position)
+        else:
+            fig.tight_layout(rect=(0, 0, 1, plan.topspace))
+            if reuse_figure and len(fig.axes) > len(ax_dic):
+                # Colour bars re-split the gridspec of their axes, so such figures are not reused.
+                del _figure_templates[_template_key(plan)]
+            elif reuse_figure:
+                template[2] = {ax_key: ax.get_position() for ax_key, ax in ax_dic.items()}
+
+    return fig
+
+def _panel_boxes(plan, dpi):
+    # Figure size in pixels, height of the title strip and the pixel box
+    # (left, top, right, bottom) of each subplot's grid cells.
+    width = int(round(plan.figsize[0] * dpi))
+    height = int(round(plan.figsize[1] * dpi))
+    top = height - int(round(height * plan.topspace))
+    N_rows, N_columns = plan.shape
+
+    def column(index):
+        return int(round(index * width / N_columns))
+    def row(index):
+        return top + int(round(index * (height - top) / N_rows))
+
+    boxes = OrderedDict()
+    for ax_key in plan.axes:
+        (row_index, column_index), colspan, rowspan = ax_key
+        boxes[ax_key] = (column(column_index), row(row_index),
+                         column(column_index + colspan), row(row_index + rowspan))
+    return (width, height), top, boxes
+
+def _fit_rgba(rgba, width, height):
+    # Crops or pads (with white) a rendered panel to exactly width x height pixels.
+    fitted = numpy.full((height, width, 4), 255, dtype=numpy.uint8)
+    fitted[:min(height, rgba.shape[0]), :min(width, rgba.shape[1])] = rgba[:height, :width]
+    return fitted
+
+def _draw_panel(plot_data, plan, ax_key, width, height, dpi, filename):
+    # Draws one subplot on its own figure of the size of its grid cells.
+    panel_key = ((0, 0), 1, 1)
+    axis = plan.axes[ax_key]
+    panel_plan = RenderPlan((1, 1), (width / dpi, height / dpi), '', 1, dpi,
+                            FrozenDict({panel_key: axis._replace(key=panel_key)}),
+                            FrozenDict((plot_series, (panel_key,)) for plot_series in axis.defaults))
+    panel_data = OrderedDict((plot_series, plot_data[plot_series])
+                             for plot_series in axis.defaults if plot_series in plot_data)
+
+    fig = _draw_plot_array(panel_data, panel_plan, filename)
+    try:
+        fig.canvas.draw()
+        return _fit_rgba(numpy.asarray(fig.canvas.buffer_rgba()), width, height)
+    finally:
+        _close_figure(fig)
 
-    defaults['info_key'] = info_key
-    mylog.debug('Plot defaults: {}'.format(defaults))
+def _draw_title(plan, width, height, dpi):
+    fig = plt.figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+    try:
+        fig.text(0.5, 0.5, plan.title, ha='center', va='center', fontsize=plt.rcParams['figure.titlesize'])
+        fig.canvas.draw()
+        return _fit_rgba(numpy.asarray(fig.canvas.buffer_rgba()), width, height)
+    finally:
+        _close_figure(fig)
 
-    return defaults
+def _compose_panels(plot_data, plan, panel_cache, filename, report=NO_REPORT):
+    '''
+    Returns the plot array as an RGBA array assembled from one raster per subplot.
+    Subplots whose settings and data are unchanged are read from panel_cache,
+    the others are drawn and stored in it (unless their settings have no stable
+    key, see :func:`plotarray.cache.panel_digest`).
+    '''
+    dpi = plan.dpi or plt.rcParams['figure.dpi']
+    (width, height), title_height, boxes = _panel_boxes(plan, dpi)
+    rgba = numpy.full((height, width, 4), 255, dtype=numpy.uint8)
+
+    if title_height > 0 and plan.title:
+        rgba[:title_height] = _draw_title(plan, width, title_height, dpi)
+
+    N_drawn = 0
+    for ax_key, (left, top, right, bottom) in boxes.items():
+        width, height = right - left, bottom - top
+        key = panel_digest(plan.axes[ax_key], plot_data, (width, height), dpi)
+        panel = panel_cache.get(key) if key else None
+        if panel is None or panel.shape != (height, width, 4):
+            with report.phase('panel', ax_key):
+                panel = _draw_panel(plot_data, plan, ax_key, width, height, dpi, filename)
+            if key:
+                panel_cache.put(key, panel)
+            N_drawn += 1
+        rgba[top:bottom, left:right] = panel
+
+    mylog.info('Drew {} of {} panels of {}'.format(N_drawn, len(boxes), filename))
+    return rgba
+
+def _savefig_options(plan):
+    if plan.dpi:
+        return dict(dpi=plan.dpi)
+    return {}
+
+def _release_figure(fig):
+    # Closes fig unless it is kept as a figure template.
+    if not any(fig is template[0] for template in _figure_templates.values()):
+        _close_figure(fig)
+
+def _close_figure(fig):
+    fig.clf()
+    plt.close(fig)
 
 @log_with(mylog)
-def make_plot_array(plot_data, plot_info, filename='default_plotarray_filename.pdf'):
+def make_plot_array(plot_data, plot_info, filename='default_plotarray_filename.pdf', format=None,
+                    reuse_figure=False, panel_cache=None, report=None):
     '''The workhorse function that makes all plots in the array and saves them together in a file.
 
     |  The functions :func:`plotarray.retrieve_plot_data` and :func:`plotarray.save_plot_data`
     |  can be used together to speed up the loading of plot_data from an HDF5 file prior to
     |  calling this function.
+
+    |  Histogram series can be given as raw values (plot_dic['x']) or pre-binned as
+    |  plot_dic['counts'] and plot_dic['bin_edges'] (e.g. from numpy.histogram).
+    |  Histograms of lazily retrieved HDF5 series are binned chunk by chunk
+    |  (plot_info[ax_key]['chunk_size'] values at a time) without loading the series.
+
+    |  Scatter series with millions of points can be thinned to about one point per pixel
+    |  with plot_info[ax_key]['decimate'] and drawn as an image inside vector output with
+    |  plot_info[ax_key]['rasterized'] (both either per series dicts or one value for the axis).
+    |  Decimated series cover the same pixels, but as at most one point per pixel is drawn,
+    |  dense regions of series with alpha < 1 (the default is 0.25) are drawn lighter; set
+    |  alpha to 1 where the density of overlapping points matters.
+    |  plot_info['dpi'] sets the resolution of the figure and of rasterized series.
+
+    |  When the same layout is rendered many times with different data, reuse_figure=True
+    |  keeps the figure, its axes and the computed layout between calls (for up to
+    |  FIGURE_TEMPLATE_CACHE_SIZE layouts) and only replaces the lines, collections,
+    |  patches, images and texts drawn in the axes.  Figures with colour bars are not kept.
+
+    |  A :class:`plotarray.RenderReport` passed as report records the wall time, CPU time,
+    |  number of points (and, with trace_memory, peak memory) of each phase: 'defaults',
+    |  'figure', 'draw' (per panel and series), 'layout', 'savefig' and, with a panel
+    |  cache, 'panel'.  Without one nothing is measured.
+
+    |  With a :class:`plotarray.PanelCache` every subplot is drawn as a raster of its own
+    |  grid cells (and the title in the strip above topspace) and stored under a hash of
+    |  its settings and data, so after a data update only the subplots whose series
+    |  changed are drawn again.  The file then holds the assembled raster, also for
+    |  vector formats such as pdf.
+
+    |  Axes of type 'density' bin x/y into an N_bins grid (chunk by chunk for lazily
+    |  retrieved series) and draw it as one image using colour_map, optionally with
+    |  log scaled counts (log) and a colour bar (colourbar).
     
     :param plot_data: All data series referred to in plot_info are contained in plot_data.
     :type plot_data: :py:obj:`dict`
-    :param plot_info: All information about how to construct the plot is contained in plot_info.
-    :type plot_info: :py:obj:`dict`
+    :param plot_info: All information about how to construct the plot is contained in plot_info, |br|
+                      or a render plan compiled from it by :func:`plotarray.compile_plot_info`.
+    :type plot_info: :py:obj:`dict` or :py:obj:`RenderPlan`
     :param filename: The filename to save the plot as. The extension of this filename |br|
-                     should be one that is recognized by matplotlib.
+                     should be one that is recognized by matplotlib. |br|
+                     A writable binary file object can be given instead.
     :type filename: :py:obj:`str`
+    :param format: The output format (e.g. 'png', 'svg' or 'pdf') if it should not be |br|
+                   taken from the extension of filename.
+    :type format: :py:obj:`str`
+    :param reuse_figure: Keep the figure and its layout for the next call with the same |br|
+                         layout and only replace the data drawn in it |br|
+                         (see :func:`plotarray.clear_figure_templates`).
+    :type reuse_figure: :py:obj:`bool`
+    :param panel_cache: Reuse unchanged subplots from this cache.
+    :type panel_cache: :py:obj:`PanelCache`
+    :param report: Records the time spent in each phase of the render.
+    :type report: :py:obj:`RenderReport`
     '''
-    fig, ax_dic = _get_figure(plot_info)
-
-    for ax_key, ax in ax_dic.items():
-        for plot_series, plot_dic in plot_data.items():
-            if plot_series not in plot_info[ax_key]['series']:
-                continue
-            if len(plot_dic['x']) < 1:
-                mylog.info('Skipping plot_series {} because it has zero data points.'.format(plot_series))
-                continue
-            if len(plot_dic['y']) != len(plot_dic['x']):
-                mylog.info('Skipping plot_series {} because len(y) != len(x).'.format(plot_series))
-                continue
-            #print((len(plot_dic['x']), len(plot_dic['y'])))
-
-            defaults = _get_plot_defaults(ax_key, plot_series, plot_info, filename)
-                
-            if plot_info[ax_key]['type'] == 'scatter':
-                ax_dic[ax_key] = _plot_scatter(plot_dic, ax, defaults)
-
-            elif plot_info[ax_key]['type'] == 'histogram':
-                ax_dic[ax_key] = _plot_histogram(plot_dic, ax, defaults)
-
-        for line_key in ('axvlines', 'axhlines'):
-            if line_key in plot_info[ax_key]['mpl'].keys():
-                for axl in plot_info[ax_key]['mpl'][line_key]: 
-                    if axl.get('color', False):
-                        if axl['color'] in colour_dic.keys():
-                            axl['color'] = colour_dic[axl['color']]
-                    if line_key == 'axvlines':
-                        ax.axvline(**axl)
-                    if line_key == 'axhlines':
-                        ax.axhline(**axl)
-
-                del plot_info[ax_key]['mpl'][line_key]
-
-        if plot_info[ax_key]['mpl'].get('xticklabels'):
-            if plot_info[ax_key]['mpl'].get('rotate_xticklabels'):
-                rotation = plot_info[ax_key]['mpl']['rotate_xticklabels']
-                del plot_info[ax_key]['mpl']['rotate_xticklabels']
-                
-            ax.set_xticklabels(plot_info[ax_key]['mpl']['xticklabels'], rotation=rotation)
-            del plot_info[ax_key]['mpl']['xticklabels']
-                
-        plt.setp(ax, **plot_info[ax_key]['mpl'])
-
-    plt.tight_layout(rect=(0, 0, 1, plot_info.get('topspace', 1)))
+    report = report or NO_REPORT
+    with report.phase('defaults'):
+        plan = as_render_plan(plot_info)
+
+    if panel_cache is not None:
+        rgba = _compose_panels(plot_data, plan, panel_cache, filename, report)
+        mylog.info('Saving figure: {0}'.format(filename))
+        with report.phase('savefig'):
+            plt.imsave(filename, rgba, format=format, dpi=plan.dpi or plt.rcParams['figure.dpi'])
+        return
+
+    fig = _draw_plot_array(plot_data, plan, filename, reuse_figure, report)
         
     mylog.info('Saving figure: {0}'.format(filename))
-    plt.savefig(filename)
-    fig.clf()
-    plt.close()
+    with report.phase('savefig'):
+        fig.savefig(filename, format=format, **_savefig_options(plan))
+    _release_figure(fig)
+
+@log_with(mylog)
+def render_plot_array(plot_data, plot_info, format='png', reuse_figure=False, panel_cache=None, report=None):
+    '''Makes the plot array like :func:`plotarray.make_plot_array`, but returns it instead of writing a file.
+
+    |  With format='rgba' the pixels of the Agg canvas are returned as a numpy array of
+    |  shape (height, width, 4) and dtype uint8 without copying them (they are copied
+    |  with reuse_figure, whose canvas is drawn again by the next render).  Any other
+    |  format supported by matplotlib (e.g. 'png', 'svg' or 'pdf') is returned as bytes.
+
+    :param plot_data: All data series referred to in plot_info are contained in plot_data.
+    :type plot_data: :py:obj:`dict`
+    :param plot_info: All information about how to construct the plot, or a compiled render plan.
+    :type plot_info: :py:obj:`dict` or :py:obj:`RenderPlan`
+    :param format: 'rgba' or a matplotlib output format.
+    :type format: :py:obj:`str`
+    :param reuse_figure: Keep the figure for the next render with the same layout, |br|
+                         as in :func:`plotarray.make_plot_array`.
+    :type reuse_figure: :py:obj:`bool`
+    :param panel_cache: Reuse unchanged subplots from this cache, as in :func:`plotarray.make_plot_array`.
+    :type panel_cache: :py:obj:`PanelCache`
+    :param report: Records the time spent in each phase, as in :func:`plotarray.make_plot_array`.
+    :type report: :py:obj:`RenderReport`
+    :returns: :py:obj:`numpy.ndarray` for format='rgba', otherwise :py:obj:`bytes`
+    '''
+    report = report or NO_REPORT
+    with report.phase('defaults'):
+        plan = as_render_plan(plot_info)
+
+    if panel_cache is not None:
+        rgba = _compose_panels(plot_data, plan, panel_cache, '<{}>'.format(format), report)
+        if format == 'rgba':
+            return rgba
+        buffer = io.BytesIO()
+        with report.phase('savefig'):
+            plt.imsave(buffer, rgba, format=format, dpi=plan.dpi or plt.rcParams['figure.dpi'])
+        return buffer.getvalue()
+
+    fig = _draw_plot_array(plot_data, plan, '<{}>'.format(format), reuse_figure, report)
+
+    try:
+        with report.phase('savefig'):
+            if format == 'rgba':
+                fig.canvas.draw()
+                rgba = numpy.asarray(fig.canvas.buffer_rgba())
+                return rgba.copy() if reuse_figure else rgba
+
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format=format, **_savefig_options(plan))
+            return buffer.getvalue()
+    finally:
+        _release_figure(fig)
+
+@log_with(mylog)
+def make_plot_pages(plot_data, plot_infos, filename='default_plotarray_filename.pdf', metadata=None,
+                    reuse_figure=False, report=None):
+    '''Makes one plot array per plot_info and writes them as the pages of a single PDF file.
+
+    |  The file is written through one open handle, so fonts and other resources are
+    |  embedded once and shared by all pages, and no merge step is needed afterwards.
+    |  Each figure is closed as soon as its page is written.
+
+    :param plot_data: The plot_data used by every page, or a list with one plot_data per page.
+    :type plot_data: :py:obj:`dict` or :py:obj:`list`
+    :param plot_infos: An iterable of plot_info dictionaries (or render plans), one per page.
+    :param filename: The PDF filename (or a writable binary file object).
+    :type filename: :py:obj:`str`
+    :param metadata: PDF document information, e.g. dict(Title='Report', Author='...').
+    :type metadata: :py:obj:`dict`
+    :param reuse_figure: Reuse one figure for all pages with the same layout, |br|
+                         as in :func:`plotarray.make_plot_array`.
+    :type reuse_figure: :py:obj:`bool`
+    :param report: Records the time spent in each phase of every page, as in :func:`plotarray.make_plot_array`.
+    :type report: :py:obj:`RenderReport`
+    :returns: The number of pages written (:py:obj:`int`).
+    '''
+    report = report or NO_REPORT
+
+    if isinstance(plot_data, (list, tuple)):
+        pages = zip(plot_data, plot_infos)
+    else:
+        pages = ((plot_data, plot_info) for plot_info in plot_infos)
+
+    mylog.info('Saving pages to: {0}'.format(filename))
+
+    N_pages = 0
+    with mpl_backend_pdf.PdfPages(filename, metadata=metadata) as pdf:
+        for page_plot_data, plot_info in pages:
+            with report.phase('defaults'):
+                plan = as_render_plan(plot_info)
+            fig = _draw_plot_array(page_plot_data, plan, filename, reuse_figure, report)
+            with report.phase('savefig'):
+                pdf.savefig(fig, **_savefig_options(plan))
+            _release_figure(fig)
+            N_pages += 1
+
+    return N_pages
@@ -0,0 +1,132 @@
+'''
+Module that holds the columnar plot_data container.
+'''
+
+__all__ = ['PlotData', 'Series']
+
+from . external import *
+mylog = LazyLogger(__name__)
+
+from . hdf5 import LazySeries
+
+
+def _column(values):
+    # A read-only view of values as a contiguous numpy array; only lists and
+    # arrays that are not contiguous yet are copied.
+    array = numpy.require(values[()] if is_h5py_dataset(values) else values, requirements='C')
+    if array.dtype.kind == 'O':
+        raise ValueError('Cannot store values of type {} as a column.'.format(type(values)))
+    view = array.view()
+    view.setflags(write=False)
+    return view
+
+
+class Series(Mapping):
+    '''
+    The columns (data_key: read-only numpy array) of one plot_data series.
+
+    The columns are checked once when the series is made: x and y have the
+    same length, bin_edges has one more value than counts and a matrix has
+    two dimensions.  Indexing returns the stored array itself, which cannot
+    be written to, so plotting never copies or modifies the data.
+
+    :param name: The series_key of the series.
+    :param columns: A mapping of data_key to values (arrays, sequences or h5py datasets).
+    :raises ValueError: if the columns are inconsistent.
+    '''
+    __slots__ = ('name', 'length', '_columns', '_skip_reasons')
+
+    def __init__(self, name, columns):
+        self.name = name
+        self._columns = OrderedDict((data_key, _column(values)) for data_key, values in columns.items())
+        self._skip_reasons = {}
+
+        if 'x' in self._columns and 'y' in self._columns and len(self._columns['x']) != len(self._columns['y']):
+            raise ValueError('Series {} has len(y) != len(x).'.format(name), len(self._columns['x']), len(self._columns['y']))
+        if 'counts' in self._columns and len(self._columns.get('bin_edges', ())) != len(self._columns['counts']) + 1:
+            raise ValueError('Series {} has len(bin_edges) != len(counts) + 1.'.format(name))
+        if 'matrix' in self._columns and self._columns['matrix'].ndim != 2:
+            raise ValueError('Series {} has a matrix with {} dimensions.'.format(name, self._columns['matrix'].ndim))
+
+        self.length = len(self._columns['x']) if 'x' in self._columns else None
+
+    def __getitem__(self, data_key):
+        return self._columns[data_key]
+
+    def __iter__(self):
+        return iter(self._columns)
+
+    def __len__(self):
+        return len(self._columns)
+
+    def __repr__(self):
+        columns = ', '.join('{}:{}{}'.format(data_key, column.dtype, list(column.shape))
+                            for data_key, column in self._columns.items())
+        return 'Series({!r}, {})'.format(self.name, columns)
+
+    @property
+    def nbytes(self):
+        '''The memory used by the columns in bytes.'''
+        return sum(column.nbytes for column in self._columns.values())
+
+
+class PlotData(Mapping):
+    '''
+    A read-only plot_data mapping of series_key to :class:`Series`.
+
+    It can be used everywhere a plot_data dictionary is accepted::
+
+        plot_data = PlotData(dict(run_1=dict(x=x, y=y)))
+        make_plot_array(plot_data, plot_info, 'run_1.pdf')
+        plot_data.save('run_1.h5', compression='gzip')
+        plot_data = PlotData.load('run_1.h5')
+
+    :param plot_data: A plot_data dictionary (or a :class:`plotarray.hdf5.LazyPlotData`, which is read completely).
+    :raises ValueError: if the columns of a series are inconsistent.
+    '''
+    __slots__ = ('_series',)
+
+    def __init__(self, plot_data=()):
+        self._series = OrderedDict()
+        for series_key, series_dic in dict(plot_data).items():
+            self.add(series_key, series_dic)
+
+    def add(self, series_key, columns):
+        '''Adds (or replaces) the series series_key and returns its :class:`Series`.'''
+        if isinstance(columns, LazySeries):
+            columns = OrderedDict((data_key, columns.read(data_key)) for data_key in columns)
+        self._series[series_key] = Series(series_key, columns)
+        return self._series[series_key]
+
+    def __getitem__(self, series_key):
+        return self._series[series_key]
+
+    def __iter__(self):
+        return iter(self._series)
+
+    def __len__(self):
+        return len(self._series)
+
+    def __repr__(self):
+        return 'PlotData({})'.format(', '.join(repr(series) for series in self._series.values()))
+
+    @property
+    def nbytes(self):
+        '''The memory used by all columns in bytes.'''
+        return sum(series.nbytes for series in self._series.values())
+
+    @classmethod
+    def load(cls, filename):
+        '''
+        Reads a file written by :func:`plotarray.save_plot_data` or :meth:`save`.
+
+        :returns: :py:obj:`None` if filename does not exist, otherwise a :class:`PlotData`.
+        '''
+        from . core import retrieve_plot_data
+        plot_data = retrieve_plot_data(filename, verbose=False)
+        return None if plot_data is None else cls(plot_data)
+
+    def save(self, filename, **options):
+        '''Writes the series with :func:`plotarray.save_plot_data`, which takes the same options.'''
+        from . core import save_plot_data
+        save_plot_data(self, filename, **options)
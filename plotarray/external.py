@@ -1,43 +1,111 @@
+import io
 import os
+import time
+import signal
 import inspect
+import logging
 import webcolors
 import itertools
+import threading
+import traceback
+import functools
+import multiprocessing
+import concurrent.futures
 
 ###########################################################
 #   Start of external imports 
 ###########################################################
+import sys
+import importlib
+
 import numpy
-from scipy import stats as scipy_stats
-from scipy.optimize import curve_fit as scipy_curve_fit
-import h5py
 
-import matplotlib
-matplotlib.use('Agg')
+from collections.abc import Mapping
+from corefunctions import namedtuple, defaultdict, OrderedDict
+
+from logbuilder import setup_custom_logger, log_with
+
+
+class LazyModule(object):
+    '''
+    Stands in for a module that is imported the first time one of its attributes is used.
+
+    The heavy dependencies (scipy, h5py and matplotlib) are bound to these placeholders
+    so that importing plotarray does not import them.  setup is called once, just
+    before the import.
+    '''
+
+    def __init__(self, module_name, setup=None):
+        self.__dict__.update(_module_name=module_name, _setup=setup, _module=None)
+
+    def __getattr__(self, attribute):
+        module = self.__dict__['_module']
+        if module is None:
+            if self._setup:
+                self._setup()
+            module = importlib.import_module(self._module_name)
+            self.__dict__['_module'] = module
+        return getattr(module, attribute)
+
+
+# Set once _setup_matplotlib has run, so settings made by the user afterwards are kept.
+_matplotlib_ready = False
+
+def _setup_matplotlib():
+    global _matplotlib_ready
+    if _matplotlib_ready:
+        return
+    _matplotlib_ready = True
 
-from matplotlib import rcParams
+    import matplotlib
+    if 'matplotlib.pyplot' not in sys.modules:
+        matplotlib.use('Agg')
 
-rcParams['font.family'] = 'sans-serif'
-rcParams['font.serif'] = ['Computer Modern Sans Serif']
-rcParams['mathtext.default'] = 'regular'
+    from matplotlib import rcParams
 
-import matplotlib.pyplot as plt
-import matplotlib.gridspec as mpl_gridspec
-import matplotlib.cm as mpl_colour_maps
-import matplotlib.colors as mpl_colours
+    rcParams['font.family'] = 'sans-serif'
+    rcParams['font.serif'] = ['Computer Modern Sans Serif']
+    rcParams['mathtext.default'] = 'regular'
+
+scipy_stats = LazyModule('scipy.stats')
+scipy_optimize = LazyModule('scipy.optimize')
+scipy_special = LazyModule('scipy.special')
+h5py = LazyModule('h5py')
+
+plt = LazyModule('matplotlib.pyplot', _setup_matplotlib)
+mpl_gridspec = LazyModule('matplotlib.gridspec', _setup_matplotlib)
+mpl_colour_maps = LazyModule('matplotlib.cm', _setup_matplotlib)
+mpl_colours = LazyModule('matplotlib.colors', _setup_matplotlib)
+mpl_collections = LazyModule('matplotlib.collections', _setup_matplotlib)
+mpl_backend_pdf = LazyModule('matplotlib.backends.backend_pdf', _setup_matplotlib)
 
 def make_colour_map(minimum_value=0, maximum_value=1, colour_map='jet'):
     return mpl_colour_maps.ScalarMappable(norm=mpl_colours.Normalize(vmin=minimum_value,
                                                                      vmax=maximum_value),
                                           cmap=plt.get_cmap(colour_map))
-
-from corefunctions import namedtuple, defaultdict, OrderedDict
-
-from logbuilder import setup_custom_logger, log_with
 ###########################################################
 #   End of external imports 
 ###########################################################
 
 logging_directory = 'log'
 
-mylog = setup_custom_logger(__name__, logging_directory=logging_directory)
-mylog.debug('Finshed importing external libraries {}'.format(__name__))
+
+class LazyLogger(object):
+    '''
+    Sets up a custom logger (and its log files) the first time it is used.
+    '''
+
+    def __init__(self, name, **kwargs):
+        self.__dict__.update(_name=name, _kwargs=kwargs, _logger=None)
+
+    def __getattr__(self, attribute):
+        logger = self.__dict__['_logger']
+        if logger is None:
+            logger = setup_custom_logger(self._name, **self._kwargs)
+            self.__dict__['_logger'] = logger
+        return getattr(logger, attribute)
+
+
+def is_h5py_dataset(item):
+    '''Checks for an h5py dataset without importing h5py when it is not loaded yet.'''
+    return 'h5py' in sys.modules and isinstance(item, h5py.Dataset)
@@ -0,0 +1,493 @@
+'''
+Module that holds the HDF5 storage routines used by plotarray.
+'''
+
+__all__ = ['LazyPlotData', 'LazySeries', 'PlotDataWriter', 'storage_array', 'dataset_options', 'fit_chunks',
+           'write_matrix_pyramid', 'read_matrix_level', 'iter_chunks', 'iter_aligned_chunks',
+           'derived_result', 'content_checksum']
+
+import hashlib
+
+from . external import *
+mylog = LazyLogger(__name__)
+
+# Number of values per chunk used for resizable datasets when no chunk shape is given.
+STREAM_CHUNK_SIZE = 2 ** 16
+
+# Number of values read at a time by iter_chunks when no chunk size is given.
+READ_CHUNK_SIZE = 2 ** 20
+
+# Suffix of the group holding the pyramid levels of a matrix dataset, e.g. 'series/matrix_pyramid'.
+PYRAMID_SUFFIX = '_pyramid'
+
+# Name of the group in each series holding cached derived results, e.g. 'series/_derived/histogram/<digest>'.
+DERIVED_GROUP = '_derived'
+
+# Attribute of every dataset written by plotarray holding its content_checksum.
+CHECKSUM_ATTRIBUTE = 'checksum'
+
+
+def content_checksum(array, previous=''):
+    '''
+    Returns a hex digest of the content of array.
+
+    Datasets written by plotarray store it in their checksum attribute, so their
+    content can be identified without reading them.  After an append it is the
+    checksum of the appended values chained to previous, the checksum before.
+    '''
+    digest = hashlib.blake2b(previous.encode(), digest_size=20)
+    digest.update(repr((array.dtype.str, array.shape[1:])).encode())
+    digest.update(numpy.ascontiguousarray(array).data)
+    return digest.hexdigest()
+
+
+def _is_helper_key(data_key):
+    # Groups plotarray stores next to the data of a series, which are not data themselves.
+    return data_key == DERIVED_GROUP or data_key.endswith(PYRAMID_SUFFIX)
+
+
+class LazySeries(Mapping):
+    '''
+    Read-only mapping of data_key to the h5py datasets of one series.
+
+    Nothing is read from disk until a dataset is indexed, so
+    ``series['x'][1000:2000]`` only reads the requested slice and
+    ``series['x'][()]`` reads the whole array.  Sub-groups are returned
+    as :class:`LazySeries` objects.  Matrix pyramids and derived results
+    can be indexed but are not listed.
+    '''
+
+    def __init__(self, h5_group):
+        self._h5_group = h5_group
+
+    def __getitem__(self, data_key):
+        item = self._h5_group[data_key]
+        if isinstance(item, h5py.Group):
+            return LazySeries(item)
+        return item
+
+    def __iter__(self):
+        return (data_key for data_key in self._h5_group if not _is_helper_key(data_key))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def read(self, data_key):
+        '''Reads the complete dataset stored under data_key into memory.'''
+        return self._h5_group[data_key][()]
+
+
+class LazyPlotData(Mapping):
+    '''
+    Read-only mapping of plot_data backed by an open HDF5 file.
+
+    Behaves like the dictionary returned by :func:`plotarray.retrieve_plot_data`,
+    except that each series is a :class:`LazySeries` whose values are h5py
+    datasets.  The file stays open until :meth:`close` is called, which
+    happens automatically when the object is used as a context manager::
+
+        with retrieve_plot_data('results.h5', lazy=True) as plot_data:
+            make_plot_array(plot_data, plot_info, 'results.pdf')
+    '''
+
+    def __init__(self, h5_file):
+        self._h5_file = h5_file
+        self.filename = h5_file.filename
+
+    def __getitem__(self, series_key):
+        return LazySeries(self._h5_file[series_key])
+
+    def __iter__(self):
+        return iter(self._h5_file)
+
+    def __len__(self):
+        return len(self._h5_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        '''Closes the underlying HDF5 file.'''
+        if self._h5_file:
+            mylog.debug('Closing HDF5 file: {}'.format(self.filename))
+            self._h5_file.close()
+
+
+def storage_array(item):
+    '''
+    Converts a plot_data value into a numpy array that can be stored in HDF5.
+
+    The dtype is taken from the array numpy builds for item, so no Python
+    level loop over the values is needed.  Numeric and boolean arrays keep
+    their dtype, python floats and ints become float64 and int64, nested
+    sequences become multi-dimensional arrays and strings are stored as
+    fixed length byte strings (|S<max length>).
+
+    :param item: A scalar, sequence or numpy array.
+    :returns: :py:obj:`numpy.ndarray`
+    '''
+    array = numpy.asarray(item)
+
+    if array.dtype.kind in 'biuf':
+        return array
+    elif array.dtype.kind == 'U':
+        return numpy.char.encode(array, 'utf-8')
+    elif array.dtype.kind == 'S':
+        return array
+
+    raise NotImplementedError('This data type has not yet been implemented.', array.dtype)
+
+
+def dataset_options(series_key, data_key, array, file_options, series_options=None):
+    '''
+    Resolves the h5py dataset creation options for one series/data_key.
+
+    The file wide file_options are updated with series_options[series_key]
+    and then with series_options[(series_key, data_key)].  Options
+    that HDF5 cannot apply (chunking or filters on scalars and empty
+    arrays) are dropped, and a chunk shape is fitted to the array (see
+    :func:`fit_chunks`), so one shape can be given for the whole file.
+
+    :param file_options: Options used for every dataset in the file, e.g. dict(chunks=True, compression='gzip').
+    :type file_options: :py:obj:`dict`
+    :param series_options: Per series or per (series_key, data_key) option dictionaries.
+    :type series_options: :py:obj:`dict`
+    :returns: :py:obj:`dict` of keyword arguments for h5py create_dataset.
+    '''
+    if array.ndim == 0 or array.size == 0:
+        return {}
+
+    options = _merge_options(series_key, data_key, file_options, series_options)
+    if isinstance(options.get('chunks'), (tuple, list)):
+        options['chunks'] = fit_chunks(options['chunks'], array.shape)
+    return options
+
+
+def fit_chunks(chunks, shape, resizable=False):
+    '''
+    Fits a chunk shape to a dataset shape.
+
+    The given sizes apply to the leading axes, axes without a size are
+    chunked whole and no size is larger than the dataset, so chunks=(65536,)
+    works for short series and matrices as well.  With resizable=True the
+    first axis is not limited, as the dataset can grow along it.
+
+    :returns: :py:obj:`tuple` of the chunk size of each axis.
+    '''
+    chunks = tuple(chunks[:len(shape)]) + tuple(shape[len(chunks):])
+    return tuple(size if resizable and axis == 0 else max(1, min(size, length))
+                 for axis, (size, length) in enumerate(zip(chunks, shape)))
+
+
+def _merge_options(series_key, data_key, file_options, series_options):
+    options = dict(file_options)
+    if series_options:
+        for lookup_key in (series_key, (series_key, data_key)):
+            options.update(series_options.get(lookup_key, {}))
+
+    return {key: value for key, value in options.items() if value is not None and value is not False}
+
+
+def iter_chunks(dataset, chunk_size=None):
+    '''
+    Yields consecutive blocks of a dataset along its first axis.
+
+    Only one block is held in memory at a time.  For chunked HDF5 datasets
+    the block size is rounded to a whole number of HDF5 chunks so every
+    chunk is read (and decompressed) once.  Works the same for numpy arrays.
+
+    :param dataset: An h5py dataset or array.
+    :param chunk_size: The number of values per block (default READ_CHUNK_SIZE).
+    :type chunk_size: :py:obj:`int`
+    '''
+    rows = _block_rows(dataset, chunk_size)
+    for start in range(0, len(dataset), rows):
+        yield dataset[start:start + rows]
+
+
+def iter_aligned_chunks(datasets, chunk_size=None):
+    '''
+    Yields tuples holding the same block of several equally long datasets,
+    e.g. the x and y of one series.  Block sizes follow :func:`iter_chunks`
+    for the first dataset.
+    '''
+    rows = _block_rows(datasets[0], chunk_size)
+    for start in range(0, len(datasets[0]), rows):
+        yield tuple(dataset[start:start + rows] for dataset in datasets)
+
+
+def _block_rows(dataset, chunk_size):
+    rows = max(1, (chunk_size or READ_CHUNK_SIZE) // max(1, int(numpy.prod(dataset.shape[1:]))))
+
+    h5_chunks = getattr(dataset, 'chunks', None)
+    if h5_chunks:
+        rows = max(1, rows // h5_chunks[0]) * h5_chunks[0]
+
+    return rows
+
+
+class PlotDataWriter(object):
+    '''
+    Appends data to a plot_data HDF5 file without rewriting it.
+
+    Uses the same series/data_key layout as :func:`plotarray.save_plot_data`,
+    but every dataset is created chunked and resizable along its first axis,
+    so a long running job can add new series and extend existing ones one
+    batch at a time::
+
+        with PlotDataWriter('results.h5') as writer:
+            for batch in simulation():
+                writer.append('run_1', 'x', batch.x)
+                writer.append('run_1', 'y', batch.y)
+
+    The dataset options (chunks, compression, compression_opts, shuffle and
+    series_options) have the same meaning as in :func:`plotarray.save_plot_data`
+    and are only used when a dataset is created.  Datasets written by
+    save_plot_data are not resizable and cannot be extended.
+    '''
+
+    def __init__(self, filename, mode='a', chunks=None, compression=None, compression_opts=None,
+                 shuffle=False, series_options=None):
+        self.filename = filename
+        self.file_options = dict(chunks=chunks, compression=compression,
+                                 compression_opts=compression_opts, shuffle=shuffle)
+        self.series_options = series_options
+        self._h5_file = h5py.File(filename, mode)
+        mylog.info('Appending plot data to: {}'.format(filename))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def append(self, series_key, data_key, values):
+        '''
+        Appends values to series_key/data_key, creating the dataset if needed.
+
+        :param values: A scalar, sequence or array.  Arrays are appended along their first axis.
+        :returns: The new length of the dataset (:py:obj:`int`).
+        '''
+        array = storage_array(values)
+        if array.ndim == 0:
+            array = array.reshape(1)
+
+        h5_key = '{}/{}'.format(series_key, data_key)
+
+        if h5_key not in self._h5_file:
+            return self._create(series_key, data_key, h5_key, array)
+
+        dataset = self._h5_file[h5_key]
+        if dataset.maxshape[0] is not None:
+            raise ValueError('Dataset {} in {} is not resizable.'.format(h5_key, self.filename))
+        if dataset.shape[1:] != array.shape[1:]:
+            raise ValueError('Cannot append data of shape {} to {} with shape {}.'.format(array.shape, h5_key, dataset.shape))
+        if array.dtype.kind == 'S' and dataset.dtype.kind == 'S':
+            if array.dtype.itemsize > dataset.dtype.itemsize:
+                raise ValueError('Strings longer than {} bytes cannot be appended to {}.'.format(dataset.dtype.itemsize, h5_key))
+        elif not numpy.can_cast(array.dtype, dataset.dtype, 'same_kind'):
+            raise ValueError('Cannot append data of type {} to {} of type {}.'.format(array.dtype, h5_key, dataset.dtype))
+
+        start = dataset.shape[0]
+        dataset.resize(start + array.shape[0], axis=0)
+        dataset[start:] = array
+        # Invalidates the derived results of the dataset (see derived_result).
+        dataset.attrs['version'] = int(dataset.attrs.get('version', 0)) + 1
+        # Datasets written by other programs have no checksum, which an append cannot add.
+        if CHECKSUM_ATTRIBUTE in dataset.attrs:
+            dataset.attrs[CHECKSUM_ATTRIBUTE] = content_checksum(array, dataset.attrs[CHECKSUM_ATTRIBUTE])
+
+        if mylog.isEnabledFor(logging.DEBUG):
+            mylog.debug('Appended {} data points to {}'.format(array.shape[0], h5_key))
+        return dataset.shape[0]
+
+    def append_series(self, series_key, series_dic):
+        '''Appends every data_key of series_dic to series_key.'''
+        for data_key, data_list in series_dic.items():
+            self.append(series_key, data_key, data_list)
+
+    def update(self, plot_data):
+        '''Appends every series of a plot_data dictionary.'''
+        for series_key, series_dic in plot_data.items():
+            self.append_series(series_key, series_dic)
+
+    def flush(self):
+        '''Flushes buffered data to disk so other readers can see it.'''
+        self._h5_file.flush()
+
+    def close(self):
+        '''Closes the underlying HDF5 file.'''
+        if self._h5_file:
+            self._h5_file.close()
+
+    def _create(self, series_key, data_key, h5_key, array):
+        options = _merge_options(series_key, data_key, self.file_options, self.series_options)
+
+        if options.get('chunks') in (None, True):
+            row_size = int(numpy.prod(array.shape[1:]))
+            options['chunks'] = (max(1, STREAM_CHUNK_SIZE // max(1, row_size)),) + array.shape[1:]
+        else:
+            options['chunks'] = fit_chunks(options['chunks'], array.shape, resizable=True)
+
+        maxshape = (None,) + array.shape[1:]
+        mylog.debug('Creating resizable dataset {} with options {}'.format(h5_key, options))
+        dataset = self._h5_file.create_dataset(h5_key, data=array, maxshape=maxshape, **options)
+        dataset.attrs[CHECKSUM_ATTRIBUTE] = content_checksum(array)
+
+        return array.shape[0]
+
+
+def _block_reduce(array, factor, ufunc):
+    rows, columns = array.shape
+    padded = numpy.pad(array, ((0, -rows % factor), (0, -columns % factor)), mode='constant')
+    blocks = padded.reshape(padded.shape[0] // factor, factor, padded.shape[1] // factor, factor)
+    return ufunc.reduce(ufunc.reduce(blocks, axis=3), axis=1)
+
+
+def _block_counts(shape, factor):
+    counts = [numpy.minimum(factor, length - numpy.arange(0, length, factor)) for length in shape]
+    return numpy.outer(counts[0], counts[1]).astype('float64')
+
+
+def _reduce_level(max_abs, mean, shape, factor, step):
+    '''Reduces a pyramid level of the given factor by step, keeping the block means exact.'''
+    sums = mean * _block_counts(shape, factor)
+    new_factor = factor * step
+    return (_block_reduce(max_abs, step, numpy.maximum),
+            _block_reduce(sums, step, numpy.add) / _block_counts(shape, new_factor))
+
+
+def write_matrix_pyramid(h5_file, h5_key, matrix, min_size=64, **options):
+    '''
+    Stores downsampled levels of a 2-D matrix next to its dataset.
+
+    Level n aggregates blocks of 2**n x 2**n cells into their maximum absolute
+    value and their signed mean, stored as h5_key + '_pyramid/<2**n>/max_abs'
+    and '.../mean'.  Levels are added until both dimensions are at most
+    min_size.  Each level is computed from the previous one.
+
+    :param h5_file: An HDF5 file open for writing.
+    :param h5_key: The 'series_key/data_key' of the full resolution matrix.
+    :param matrix: The full resolution matrix.
+    :type matrix: :py:obj:`numpy.ndarray`
+    :param min_size: Stop once the coarsest level fits in min_size x min_size cells.
+    :type min_size: :py:obj:`int`
+    :param options: h5py dataset options used for the level datasets.
+    '''
+    shape = matrix.shape
+    max_abs, mean = numpy.abs(matrix), matrix.astype('float64')
+    factor = 1
+
+    while max(mean.shape) > min_size:
+        max_abs, mean = _reduce_level(max_abs, mean, shape, factor, 2)
+        factor *= 2
+
+        level_key = '{}{}/{}'.format(h5_key, PYRAMID_SUFFIX, factor)
+        mylog.debug('Adding pyramid level {} with shape {}'.format(level_key, mean.shape))
+        h5_file.create_dataset(level_key + '/max_abs', data=max_abs, **options)
+        h5_file.create_dataset(level_key + '/mean', data=mean, **options)
+
+    h5_file.require_group(h5_key + PYRAMID_SUFFIX).attrs['shape'] = shape
+
+
+def read_matrix_level(plot_dic, data_key, max_shape):
+    '''
+    Reads the coarsest useful resolution of a matrix.
+
+    Picks the smallest power of two block factor at which the matrix fits in
+    max_shape cells.  The level is read from the pyramid stored by
+    :func:`write_matrix_pyramid` when plot_dic is lazy, without reading the
+    full resolution data, and is otherwise computed from the matrix in memory.
+
+    :param plot_dic: A series mapping holding data_key, e.g. from :func:`plotarray.retrieve_plot_data`.
+    :param data_key: The key of the matrix in plot_dic.
+    :param max_shape: The maximum number of (rows, columns) to return.
+    :returns: factor, max_abs, mean
+    '''
+    matrix = plot_dic[data_key]
+    shape = matrix.shape
+
+    factor = 1
+    while any(-(-length // factor) > max(1, limit) for length, limit in zip(shape, max_shape)):
+        factor *= 2
+
+    if factor == 1:
+        matrix = numpy.asarray(matrix)
+        return factor, numpy.abs(matrix), matrix
+
+    pyramid = plot_dic.get(data_key + PYRAMID_SUFFIX) if isinstance(plot_dic, LazySeries) else None
+    stored = sorted(int(level) for level in pyramid if int(level) <= factor) if pyramid else []
+
+    if stored:
+        level = pyramid[str(stored[-1])]
+        base_factor, max_abs, mean = stored[-1], level['max_abs'][()], level['mean'][()]
+    else:
+        base_factor, max_abs, mean = 1, numpy.abs(numpy.asarray(matrix)), numpy.asarray(matrix, dtype='float64')
+
+    if base_factor < factor:
+        max_abs, mean = _reduce_level(max_abs, mean, shape, base_factor, factor // base_factor)
+
+    mylog.debug('Using matrix level {} (stored level {}) with shape {}'.format(factor, base_factor, mean.shape))
+    return factor, max_abs, mean
+
+
+def _source_versions(h5_group, source_keys):
+    # What a derived result depends on: the shape, dtype and write version of each source dataset.
+    versions = []
+    for data_key in source_keys:
+        dataset = h5_group[data_key]
+        versions.append((data_key, dataset.shape, dataset.dtype.str, int(dataset.attrs.get('version', 0))))
+    return repr(versions)
+
+def derived_result(plot_dic, operation, parameters, source_keys, compute):
+    '''
+    Returns compute(), stored in the HDF5 file of plot_dic for the next call.
+
+    |  A result is stored per series, operation and parameters in the series'
+    |  _derived group, together with the versions of the source datasets it was
+    |  computed from.  It is computed again when a source dataset has changed: it
+    |  has a different shape (e.g. after :meth:`PlotDataWriter.append`) or
+    |  version attribute.  Changes made in place by other programs are only noticed
+    |  if they increment the version attribute of the dataset.
+
+    |  Nothing is stored if plot_dic is not a :class:`LazySeries` of a file opened
+    |  for writing (see :func:`plotarray.retrieve_plot_data`), or if parameters is None.
+
+    :param plot_dic: The series the result is derived from.
+    :param operation: The name of the computation, e.g. 'histogram'.
+    :type operation: :py:obj:`str`
+    :param parameters: Everything else the result depends on.  Its repr is part of the key.
+    :param source_keys: The data_keys of plot_dic the result is computed from.
+    :param compute: Function without arguments that returns a tuple of arrays or scalars, or None.
+    '''
+    if parameters is None or not isinstance(plot_dic, LazySeries) or plot_dic._h5_group.file.mode != 'r+':
+        return compute()
+
+    h5_group = plot_dic._h5_group
+    digest = hashlib.blake2b(repr(parameters).encode(), digest_size=16).hexdigest()
+    h5_key = '{}/{}/{}'.format(DERIVED_GROUP, operation, digest)
+    sources = _source_versions(h5_group, source_keys)
+
+    stored = h5_group.get(h5_key)
+    if stored is not None and stored.attrs['sources'] == sources:
+        mylog.debug('Using derived {} of {}'.format(operation, h5_group.name))
+        if stored.attrs['none']:
+            return None
+        return tuple(stored[str(index)][()] for index in range(len(stored)))
+
+    result = compute()
+
+    if stored is not None:
+        del h5_group[h5_key]
+    stored = h5_group.create_group(h5_key)
+    stored.attrs['parameters'] = repr(parameters)
+    stored.attrs['sources'] = sources
+    stored.attrs['none'] = result is None
+    for index, value in enumerate(result or ()):
+        stored.create_dataset(str(index), data=numpy.asarray(value))
+
+    mylog.debug('Stored derived {} of {}'.format(operation, h5_group.name))
+    return result
@@ -0,0 +1,149 @@
+'''
+Module that compiles plot_info dictionaries into reusable render plans.
+'''
+
+__all__ = ['compile_plot_info', 'as_render_plan']
+
+from . external import *
+mylog = LazyLogger(__name__)
+
+from . structures import RenderPlan, AxisPlan, FrozenDict, colour_dic
+
+# The subplot types make_plot_array can draw.
+PLOT_TYPES = ('scatter', 'histogram', 'hinton', 'density')
+
+# The data_keys of a series each plot type can read.
+PLOT_DATA_KEYS = dict(scatter=('x', 'y'), histogram=('x', 'counts', 'bin_edges'), hinton=('matrix',),
+                      density=('x', 'y'))
+
+# Top level plot_info keys that are not subplots.
+FIGURE_KEYS = ('shape', 'figsize', 'title', 'topspace', 'dpi')
+
+# Keys of plot_info[ax_key]['mpl'] that are applied separately instead of with plt.setp.
+_SPECIAL_MPL_KEYS = ('axvlines', 'axhlines', 'xticklabels', 'rotate_xticklabels')
+
+
+def _get_plot_defaults(ax_key, plot_series, plot_info):
+    if mylog.isEnabledFor(logging.DEBUG):
+        msg_tmpl = 'Processing ax_key:{} plot_series:{} plot_info:{}'
+        mylog.debug(msg_tmpl.format(ax_key, plot_series, plot_info[ax_key]))
+    
+    colour_key = plot_info[ax_key]['series'][plot_series]
+    if colour_key not in colour_dic:
+        raise ValueError('Unknown colour for plot_series {} in subplot {}.'.format(plot_series, ax_key), colour_key)
+
+    defaults = dict(alpha=0.25, markersize=2, marker='o', legend=None, addvline=False, lognormal_fit=False)
+    if plot_info[ax_key]['type'] == 'histogram':
+        defaults['N_bins'] = 50
+        defaults['chunk_size'] = None
+    if plot_info[ax_key]['type'] == 'hinton':
+        defaults['max_weight'] = None
+        defaults['pixels_per_cell'] = 4
+    if plot_info[ax_key]['type'] == 'scatter':
+        defaults['decimate'] = False
+        defaults['rasterized'] = False
+    if plot_info[ax_key]['type'] == 'density':
+        defaults.update(N_bins=200, chunk_size=None, log=False, colour_map='jet', colourbar=False)
+
+    # A value dic sets a parameter per series; any other value sets it for every series of the axis.
+    for mpl_key in defaults.keys():
+        value_dic = plot_info[ax_key].get(mpl_key, None)
+        if value_dic:
+            if isinstance(value_dic, dict):
+                defaults[mpl_key] = value_dic.get(plot_series, defaults[mpl_key])
+            else:
+                defaults[mpl_key] = value_dic
+
+    defaults['colour'] = colour_dic[colour_key]
+    defaults['plot_series'] = plot_series
+    if plot_info[ax_key]['type'] == 'histogram':
+        defaults['xlim'] = plot_info[ax_key].get('mpl', {}).get('xlim', None)
+        defaults['function'] = plot_info[ax_key].get('function', None)
+
+    if plot_info[ax_key]['type'] in ('scatter', 'density'):
+        defaults['xlim'] = plot_info[ax_key].get('mpl', {}).get('xlim', None)
+        defaults['ylim'] = plot_info[ax_key].get('mpl', {}).get('ylim', None)
+
+    if plot_info[ax_key]['type'] == 'scatter':
+        # The decimation grid is laid out in the scale of the axes.
+        defaults['xscale'] = plot_info[ax_key].get('mpl', {}).get('xscale', 'linear')
+        defaults['yscale'] = plot_info[ax_key].get('mpl', {}).get('yscale', 'linear')
+
+    if plot_info[ax_key]['type'] == 'scatter':
+        defaults['trendline'] = plot_info[ax_key].get('trendline', {}).get(plot_series, None)
+        defaults['trendline_style'] = plot_info[ax_key].get('trendline_style', {}).get(plot_series, '-')
+        defaults['trendline_through_zero'] = plot_info[ax_key].get('trendline_through_zero', {}).get(plot_series, False)
+
+    if mylog.isEnabledFor(logging.DEBUG):
+        mylog.debug('Plot defaults: {}'.format(defaults))
+
+    return FrozenDict(defaults)
+
+
+def _compile_axis(ax_key, plot_info):
+    if not (isinstance(ax_key, tuple) and len(ax_key) == 3):
+        raise ValueError('Subplot keys have to be (loc, colspan, rowspan) tuples.', ax_key)
+
+    ax_info = plot_info[ax_key]
+    if ax_info.get('type') not in PLOT_TYPES:
+        raise ValueError('Unknown plot type in subplot {}.'.format(ax_key), ax_info.get('type'))
+    mpl_info = ax_info.get('mpl', {})
+
+    defaults = FrozenDict((plot_series, _get_plot_defaults(ax_key, plot_series, plot_info))
+                          for plot_series in ax_info['series'])
+
+    lines = []
+    for line_key in ('axvlines', 'axhlines'):
+        for axl in mpl_info.get(line_key, ()):
+            axl = dict(axl)
+            if axl.get('color', False) and axl['color'] in colour_dic:
+                axl['color'] = colour_dic[axl['color']]
+            lines.append((line_key[:-1], FrozenDict(axl)))
+
+    xticklabels = mpl_info.get('xticklabels')
+    mpl = FrozenDict((key, value) for key, value in mpl_info.items() if key not in _SPECIAL_MPL_KEYS)
+
+    return AxisPlan(ax_key, ax_info['type'], defaults, tuple(lines),
+                    tuple(xticklabels) if xticklabels else None,
+                    mpl_info.get('rotate_xticklabels') or None, mpl)
+
+
+@log_with(mylog)
+def compile_plot_info(plot_info):
+    '''
+    Validates plot_info once and compiles it into an immutable render plan.
+
+    |  The plan holds the resolved defaults and colours of every series in every
+    |  subplot and an index from each series to the subplots that show it, so
+    |  :func:`plotarray.make_plot_array` (and the other render functions) can apply
+    |  it to many plot_data dictionaries without redoing that work.  Unlike passing
+    |  plot_info directly, plot_info is never modified.
+
+    :param plot_info: All information about how to construct the plot.
+    :type plot_info: :py:obj:`dict`
+    :returns: :py:obj:`RenderPlan` (a picklable namedtuple)
+    :raises ValueError: if plot_info is missing figure keys, has an unknown plot type or colour.
+    '''
+    for key in ('shape', 'figsize', 'title'):
+        if key not in plot_info:
+            raise ValueError('plot_info has no {!r} key.'.format(key))
+
+    axes = OrderedDict()
+    series_axes = OrderedDict()
+    for ax_key in plot_info:
+        if ax_key in FIGURE_KEYS:
+            continue
+        axes[ax_key] = _compile_axis(ax_key, plot_info)
+        for plot_series in axes[ax_key].defaults:
+            series_axes.setdefault(plot_series, []).append(ax_key)
+
+    return RenderPlan(tuple(plot_info['shape']), tuple(plot_info['figsize']), plot_info['title'],
+                      plot_info.get('topspace', 1), plot_info.get('dpi', None), FrozenDict(axes),
+                      FrozenDict((plot_series, tuple(ax_keys)) for plot_series, ax_keys in series_axes.items()))
+
+
+def as_render_plan(plot_info):
+    '''Returns plot_info if it already is a :py:obj:`RenderPlan`, and compiles it otherwise.'''
+    if isinstance(plot_info, RenderPlan):
+        return plot_info
+    return compile_plot_info(plot_info)
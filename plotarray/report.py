@@ -0,0 +1,153 @@
+'''
+Module that holds the timing report of renders.
+'''
+
+__all__ = ['RenderReport', 'NO_REPORT']
+
+import tracemalloc
+
+from . external import *
+mylog = LazyLogger(__name__)
+
+from . structures import PhaseRecord
+
+
+class _Phase(object):
+    __slots__ = ('_report', '_name', '_panel', '_series', '_points', '_wall', '_cpu', '_memory')
+
+    def __init__(self, report, name, panel, series, points):
+        self._report = report
+        self._name = name
+        self._panel = panel
+        self._series = series
+        self._points = points
+
+    def __enter__(self):
+        self._memory = self._report._enter_memory()
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall, cpu = time.perf_counter() - self._wall, time.process_time() - self._cpu
+        self._report.add(PhaseRecord(self._name, self._panel, self._series, wall, cpu,
+                                     self._report._exit_memory(self._memory), self._points))
+
+
+class RenderReport(object):
+    '''
+    Records the wall time, CPU time, peak memory and number of points of each
+    phase of a render.
+
+    Pass one to the report argument of :func:`plotarray.make_plot_array` (or of
+    the other render functions and :func:`plotarray.retrieve_plot_data`)::
+
+        report = RenderReport()
+        make_plot_array(plot_data, plot_info, 'results.pdf', report=report)
+        print(report)
+
+    The phases are 'load' (per dataset read by retrieve_plot_data), 'defaults'
+    (compiling plot_info), 'figure', 'draw' (once per panel and series, with
+    panel, series and points set), 'layout', 'savefig' and, with a panel cache,
+    'panel' (once per subplot that is drawn again).
+
+    The peak memory is :py:obj:`None` unless trace_memory is set.  Then it is the
+    most memory Python and numpy allocated during the phase, above what was
+    allocated when it started, in bytes (memory allocated by matplotlib's C++
+    renderer is not seen).  The allocations are traced with tracemalloc, which
+    can make a render several times slower, so the recorded times then mostly
+    measure the tracing; use a separate report for timing.
+
+    :param callback: Called with every :py:obj:`PhaseRecord` when its phase ends.
+    :param trace_memory: Measure the peak memory of each phase.
+    :type trace_memory: :py:obj:`bool`
+    '''
+
+    def __init__(self, callback=None, trace_memory=False):
+        self.records = []
+        self.callback = callback
+        self.trace_memory = trace_memory
+        # [memory at the start, highest memory so far] of every running phase.
+        self._memory_stack = []
+        self._started_tracing = False
+
+    def phase(self, name, panel=None, series=None, points=None):
+        '''Returns a context manager that records the phase it encloses.'''
+        return _Phase(self, name, panel, series, points)
+
+    def add(self, record):
+        self.records.append(record)
+        if self.callback:
+            self.callback(record)
+
+    def _enter_memory(self):
+        if not self.trace_memory:
+            return None
+        if not self._memory_stack and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+        current, peak = tracemalloc.get_traced_memory()
+        if self._memory_stack:
+            # The peak is reset for the new phase, so the enclosing phase keeps the peak so far.
+            self._memory_stack[-1][1] = max(self._memory_stack[-1][1], peak)
+        tracemalloc.reset_peak()
+        memory = [current, current]
+        self._memory_stack.append(memory)
+        return memory
+
+    def _exit_memory(self, memory):
+        if memory is None:
+            return None
+        peak = max(memory[1], tracemalloc.get_traced_memory()[1])
+        self._memory_stack.pop()
+        if self._memory_stack:
+            self._memory_stack[-1][1] = max(self._memory_stack[-1][1], peak)
+        elif self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        return peak - memory[0]
+
+    def summary(self):
+        '''
+        Returns an OrderedDict of phase name: dict(count, wall_seconds, cpu_seconds, points),
+        summed over all records of the phase.
+        '''
+        phases = OrderedDict()
+        for record in self.records:
+            totals = phases.setdefault(record.phase, dict(count=0, wall_seconds=0.0, cpu_seconds=0.0, points=0))
+            totals['count'] += 1
+            totals['wall_seconds'] += record.wall_seconds
+            totals['cpu_seconds'] += record.cpu_seconds
+            totals['points'] += record.points or 0
+        return phases
+
+    def __str__(self):
+        lines = ['{:<10} {:>6} {:>10} {:>10} {:>12}'.format('phase', 'count', 'wall [s]', 'cpu [s]', 'points')]
+        for name, totals in self.summary().items():
+            lines.append('{:<10} {count:>6} {wall_seconds:>10.4f} {cpu_seconds:>10.4f} {points:>12}'.format(name, **totals))
+        return '\n'.join(lines)
+
+
+class _NullPhase(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return None
+
+
+class _NullReport(object):
+    '''Used when no report is requested: every phase is the same object that does nothing.'''
+    __slots__ = ()
+    _phase = _NullPhase()
+
+    def phase(self, name, panel=None, series=None, points=None):
+        return self._phase
+
+    def add(self, record):
+        pass
+
+NO_REPORT = _NullReport()
@@ -0,0 +1,154 @@
+'''
+Module that holds a long running render server and its client.
+
+Start a server once (it keeps matplotlib, scipy and h5py imported)::
+
+    python -m plotarray.server /tmp/plotarray.sock --processes 4
+
+and send it jobs from short lived scripts::
+
+    with RenderClient('/tmp/plotarray.sock') as client:
+        result = client.render('results.h5', plot_info, 'results.pdf')
+'''
+
+__all__ = ['RenderServer', 'RenderClient']
+
+import argparse
+from multiprocessing.connection import Listener, Client
+
+from . external import *
+mylog = LazyLogger(__name__)
+
+from . structures import RenderResult
+from . batch import _init_worker, _render_job
+
+
+class RenderServer(object):
+    '''
+    Serves :func:`plotarray.make_plot_array` jobs over a Unix socket (or TCP address).
+
+    Jobs run in a pool of worker processes that are started once, so the cost of
+    starting Python and importing matplotlib, scipy and h5py is not paid per plot.
+    Each worker is replaced after max_jobs_per_worker jobs to release the memory
+    matplotlib accumulates.  Every client connection is handled in its own thread.
+
+    Jobs are unpickled, so a client can run any code in the server.  A socket
+    path is only reachable by users with access to it; a (host, port) address
+    is reachable over the network and therefore needs an authkey.
+
+    :param address: A socket path, or a (host, port) tuple.
+    :param processes: The number of worker processes.
+    :type processes: :py:obj:`int`
+    :param max_jobs_per_worker: Replace each worker after this many jobs.
+    :type max_jobs_per_worker: :py:obj:`int`
+    :param authkey: Key clients have to present (:py:obj:`bytes`), required for (host, port) addresses.
+    :raises ValueError: for a (host, port) address without an authkey.
+    '''
+
+    def __init__(self, address, processes=1, max_jobs_per_worker=100, authkey=None):
+        if isinstance(address, tuple) and not authkey:
+            raise ValueError('A render server on {} needs an authkey, as any client can run code in it.'.format(address))
+        self.address = address
+        self._pool = multiprocessing.Pool(processes, initializer=_init_worker,
+                                          maxtasksperchild=max_jobs_per_worker)
+        self._listener = Listener(address, authkey=authkey)
+        mylog.info('Render server listening on {} with {} processes'.format(address, processes))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def serve_forever(self):
+        '''Accepts client connections until the server is closed.'''
+        while True:
+            try:
+                connection = self._listener.accept()
+            except OSError:
+                break
+            thread = threading.Thread(target=self._serve_connection, args=(connection,))
+            thread.daemon = True
+            thread.start()
+
+    def render(self, plot_data, plot_info, filename):
+        '''Renders one job in the worker pool and returns its :class:`RenderResult`.'''
+        return self._pool.apply(_render_job, (0, plot_data, plot_info, filename))
+
+    def close(self):
+        '''Stops accepting connections and shuts the worker pool down.'''
+        self._listener.close()
+        self._pool.close()
+        self._pool.join()
+
+    def _serve_connection(self, connection):
+        with connection:
+            while True:
+                try:
+                    job = connection.recv()
+                except EOFError:
+                    break
+                if job is None:
+                    break
+                try:
+                    result = self.render(*job)
+                except Exception:
+                    result = RenderResult(0, job[2], traceback.format_exc(), None, None)
+                connection.send(result)
+
+
+class RenderClient(object):
+    '''
+    Sends make_plot_array jobs to a :class:`RenderServer`.
+
+    plot_data can be a plot_data dictionary or the filename of an HDF5 file
+    written by :func:`plotarray.save_plot_data`, which the server then reads
+    lazily instead of receiving the data over the socket.
+    '''
+
+    def __init__(self, address, authkey=None):
+        self._connection = Client(address, authkey=authkey)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def render(self, plot_data, plot_info, filename):
+        '''
+        Renders one plot array on the server and waits for it to finish.
+
+        :returns: RenderResult(index, filename, error, seconds, peak_memory)
+        '''
+        self._connection.send((plot_data, plot_info, filename))
+        return self._connection.recv()
+
+    def close(self):
+        '''Closes the connection to the server.'''
+        if not self._connection.closed:
+            self._connection.send(None)
+            self._connection.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve plotarray render jobs over a Unix socket.')
+    parser.add_argument('address', help='Path of the Unix socket to listen on.')
+    parser.add_argument('--processes', type=int, default=1, help='Number of worker processes.')
+    parser.add_argument('--max-jobs-per-worker', type=int, default=100,
+                        help='Replace each worker after this many jobs.')
+    args = parser.parse_args(argv)
+
+    def stop(signal_number, frame):
+        raise KeyboardInterrupt()
+    signal.signal(signal.SIGTERM, stop)
+
+    with RenderServer(args.address, args.processes, args.max_jobs_per_worker) as server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -2,13 +2,13 @@
 Module that holds various statistical routines.
 '''
 
-__all__ = ['fit_lognormal_to_histogram', 'list_stats']
+__all__ = ['fit_lognormal_to_histogram', 'fit_lognormal_to_histograms', 'list_stats', 'StatsAccumulator']
 
 from . external import *
-mylog = setup_custom_logger(__name__)
-mylog.debug('Entering {0}'.format(__name__))
+mylog = LazyLogger(__name__)
 
-from . structures import ListStats, MeanSTD
+from . structures import ListStats, MeanSTD, LognormalFit
+from . hdf5 import iter_chunks
 
 def fit_lognormal_to_histogram(hist=None, bin_edges=None):
     '''Fit a lognormal distribution to histogram data using the
@@ -31,21 +31,349 @@ def fit_lognormal_to_histogram(hist=None, bin_edges=None):
     x : x values of pdf at bin locations
     y : y values of pdf at bin locations
     stats : namedtuple(mean, standard_deviation)
+
+    Raises
+    ======
+    RuntimeError : if the fit does not converge
+    '''
+    fit, = fit_lognormal_to_histograms([hist], [bin_edges])
+    if not fit.converged:
+        raise RuntimeError('Lognormal fit did not converge after {} iterations.'.format(fit.iterations), fit)
+
+    return fit.x_pdf, fit.y_pdf, fit.stats
+
+
+def _pad_rows(arrays, fill):
+    # Stacks arrays of different lengths into one 2-D array, padded with fill.
+    arrays = [numpy.asarray(array, dtype='float64') for array in arrays]
+    padded = numpy.full((len(arrays), max(array.size for array in arrays)), fill)
+    for row, array in zip(padded, arrays):
+        row[:array.size] = array
+    return padded
+
+def _lognormal_cdf(log_x, valid, mu, log_sigma):
+    # CDF of every bin edge and its derivatives with respect to mu and log(sigma).
+    sigma = numpy.exp(log_sigma)[:, None]
+    z = (log_x - mu[:, None]) / sigma
+    density = numpy.where(valid, numpy.exp(-0.5 * z * z) / numpy.sqrt(2 * numpy.pi), 0.0)
+    cdf = numpy.where(valid, scipy_special.ndtr(z), 0.0)
+    return cdf, -density / sigma, -density * z
+
+def _log_quantiles(edges, y_cdf, probabilities):
+    # The logs of the values at which the cumulative counts (at the upper bin edges,
+    # starting from 0 at the first edge) reach probabilities, or None if fewer than
+    # two positive edges have a distinct value.
+    x, cumulative = edges, numpy.concatenate([[0.0], y_cdf])
+    positive = x > 0
+    if positive.sum() < 2:
+        return None
+    levels, first = numpy.unique(cumulative[positive], return_index=True)
+    if levels.size < 2:
+        return None
+    return numpy.interp(probabilities, levels, numpy.log(x[positive][first]))
+
+def _curve_fit_row(index, edges, y_cdf, mu, log_sigma, cost):
+    # Fits one histogram with curve_fit from its current parameters and keeps the result
+    # if it is at least as good.  Returns whether curve_fit succeeded.
+    x_cdf, y = edges[1:], y_cdf[index, :edges.size - 1]
+    positive = x_cdf > 0
+    log_x = numpy.log(numpy.where(positive, x_cdf, 1.0))
+
+    def cdf(x, mu, log_sigma):
+        return numpy.where(positive, scipy_special.ndtr((log_x - mu) / numpy.exp(log_sigma)), 0.0)
+
+    try:
+        (new_mu, new_log_sigma), _ = scipy_optimize.curve_fit(cdf, x_cdf, y, p0=(mu[index], log_sigma[index]))
+    except (RuntimeError, ValueError):
+        return False
+
+    new_cost = ((cdf(x_cdf, new_mu, new_log_sigma) - y) ** 2).sum()
+    if new_cost <= cost[index]:
+        mu[index], log_sigma[index], cost[index] = new_mu, new_log_sigma, new_cost
+    return True
+
+def fit_lognormal_to_histograms(hists, bin_edges, max_iterations=100, tolerance=1e-10):
+    '''Fit lognormal distributions to many histograms at once.
+
+    Fits the same model as fit_lognormal_to_histogram (the lognormal CDF
+    to the normalised cumulative counts at the upper bin edges), with a
+    Levenberg-Marquardt iteration that updates every histogram at the
+    same time.  It starts from the median and the 16th and 84th percentiles
+    of the cumulative counts, interpolated in the logarithm of the bin
+    edges, and uses the analytic derivatives of the CDF.  Histograms that
+    have not converged after max_iterations are fitted once more with
+    scipy.optimize.curve_fit, starting from where the iteration stopped.
+
+    Parameters
+    ==========
+    hists : sequence of arrays
+        The counts of each histogram.  The histograms can have different numbers of bins.
+
+    bin_edges : sequence of arrays
+        The bin edges of each histogram (one more than its counts).
+
+    max_iterations : int
+        The number of batched iterations before the remaining histograms are
+        fitted with curve_fit.  A histogram curve_fit cannot fit either is
+        returned with converged=False.
+
+    tolerance : float
+        Converged when the gradient is this close to orthogonal to the residuals
+        (the cosine between them), or a step changes the sum of squared residuals
+        by less than this fraction or both parameters by less than this fraction.
+
+    Returns
+    =======
+    fits : list of LognormalFit(x_pdf, y_pdf, stats, converged, iterations, cost) namedtuples,
+           where stats is MeanSTD(scale, shape) as returned by fit_lognormal_to_histogram
+           and cost is the final sum of squared residuals.
+    '''
+    hists = [numpy.asarray(hist) for hist in hists]
+    bin_edges = [numpy.asarray(edges) for edges in bin_edges]
+    if len(hists) < 1:
+        return []
+
+    counts = _pad_rows(hists, 0.0)
+    cumulative = counts.cumsum(axis=1)
+    used = numpy.arange(counts.shape[1]) < numpy.array([hist.size for hist in hists])[:, None]
+    y_cdf = cumulative / cumulative.max(axis=1, keepdims=True)
+
+    upper_edges = _pad_rows([edges[1:] for edges in bin_edges], 1.0)
+    centres = (_pad_rows([edges[:-1] for edges in bin_edges], 1.0) + upper_edges) / 2.0
+    valid = used & (upper_edges > 0)
+    log_x = numpy.log(numpy.where(valid, upper_edges, 1.0))
+
+    # Starting values from the moments of the log of the bin centres, replaced below
+    # by the quantiles of the cumulative counts where there are enough positive edges.
+    weights = numpy.where(centres > 0, counts, 0.0)
+    log_centres = numpy.log(numpy.where(centres > 0, centres, 1.0))
+    total = numpy.maximum(weights.sum(axis=1), 1e-300)
+    mu = (weights * log_centres).sum(axis=1) / total
+    variance = (weights * (log_centres - mu[:, None]) ** 2).sum(axis=1) / total
+    width = numpy.abs(numpy.diff(log_x, axis=1)).mean(axis=1) if log_x.shape[1] > 1 else numpy.ones(len(mu))
+    for index, edges in enumerate(bin_edges):
+        quantiles = _log_quantiles(edges, y_cdf[index, :edges.size - 1], (0.5, 0.15866, 0.84134))
+        if quantiles is not None:
+            mu[index], variance[index] = quantiles[0], ((quantiles[2] - quantiles[1]) / 2.0) ** 2
+    log_sigma = 0.5 * numpy.log(numpy.maximum(variance, width ** 2 / 12.0 + 1e-12))
+
+    def residuals(mu, log_sigma, rows):
+        cdf, d_mu, d_log_sigma = _lognormal_cdf(log_x[rows], valid[rows], mu, log_sigma)
+        residual = numpy.where(used[rows], cdf - y_cdf[rows], 0.0)
+        return residual, d_mu, d_log_sigma
+
+    N_series = len(hists)
+    damping = numpy.full(N_series, 1e-3)
+    converged = numpy.zeros(N_series, dtype=bool)
+    iterations = numpy.zeros(N_series, dtype=int)
+    residual = residuals(mu, log_sigma, slice(None))[0]
+    cost = (residual ** 2).sum(axis=1)
+
+    for iteration in range(max_iterations):
+        rows = numpy.flatnonzero(~converged)
+        if rows.size < 1:
+            break
+        iterations[rows] += 1
+
+        residual, d_mu, d_log_sigma = residuals(mu[rows], log_sigma[rows], rows)
+        # Normal equations of the 2 parameter least squares problem of every histogram.
+        a = (d_mu * d_mu).sum(axis=1)
+        b = (d_mu * d_log_sigma).sum(axis=1)
+        c = (d_log_sigma * d_log_sigma).sum(axis=1)
+        g_mu = (d_mu * residual).sum(axis=1)
+        g_log_sigma = (d_log_sigma * residual).sum(axis=1)
+        # The cosine between the residuals and each column of the Jacobian, as in MINPACK.
+        residual_norm = numpy.sqrt(cost[rows])
+        small_gradient = (numpy.abs(g_mu) <= tolerance * residual_norm * numpy.sqrt(a)) & \
+                         (numpy.abs(g_log_sigma) <= tolerance * residual_norm * numpy.sqrt(c))
+
+        a_damped = a + damping[rows] * numpy.maximum(a, 1e-12)
+        c_damped = c + damping[rows] * numpy.maximum(c, 1e-12)
+        determinant = a_damped * c_damped - b * b
+        determinant = numpy.where(numpy.abs(determinant) > 1e-300, determinant, 1e-300)
+        step_mu = -(c_damped * g_mu - b * g_log_sigma) / determinant
+        step_log_sigma = -(a_damped * g_log_sigma - b * g_mu) / determinant
+
+        new_mu, new_log_sigma = mu[rows] + step_mu, numpy.clip(log_sigma[rows] + step_log_sigma, -50, 50)
+        new_residual = residuals(new_mu, new_log_sigma, rows)[0]
+        new_cost = (new_residual ** 2).sum(axis=1)
+
+        better = numpy.isfinite(new_cost) & (new_cost <= cost[rows])
+        accepted = rows[better]
+        mu[accepted], log_sigma[accepted] = new_mu[better], new_log_sigma[better]
+        damping[accepted] = numpy.maximum(damping[accepted] / 10.0, 1e-12)
+        damping[rows[~better]] *= 10.0
+
+        small_change = (cost[rows] - numpy.where(better, new_cost, cost[rows])) <= tolerance * cost[rows]
+        # Rejected steps shrink as the damping grows, so only accepted steps count.
+        small_step = (numpy.abs(step_mu) <= tolerance * (numpy.abs(mu[rows]) + tolerance)) & \
+                     (numpy.abs(step_log_sigma) <= tolerance * (numpy.abs(log_sigma[rows]) + tolerance))
+        cost[accepted] = new_cost[better]
+        converged[rows] = small_gradient | (better & (small_change | small_step)) | (cost[rows] == 0)
+
+    for index in numpy.flatnonzero(~converged):
+        converged[index] = _curve_fit_row(index, bin_edges[index], y_cdf, mu, log_sigma, cost)
+
+    scale, shape = numpy.exp(mu), numpy.exp(log_sigma)
+    fits = []
+    for index, edges in enumerate(bin_edges):
+        x_pdf = edges[1:]
+        positive = x_pdf > 0
+        z = (numpy.log(numpy.where(positive, x_pdf, 1.0)) - mu[index]) / shape[index]
+        y_pdf = numpy.where(positive, numpy.exp(-0.5 * z * z) / (numpy.sqrt(2 * numpy.pi) * shape[index] * x_pdf), 0.0)
+        fits.append(LognormalFit(x_pdf, y_pdf, MeanSTD(scale[index], shape[index]),
+                                 bool(converged[index]), int(iterations[index]), cost[index]))
+
+    mylog.debug('Fitted {} histograms, {} converged'.format(N_series, converged.sum()))
+    return fits
+
+
+class StatsAccumulator(object):
+    '''
+    Accumulates the statistics of list_stats over chunks of values.
+
+    The mean and standard deviation are combined with the pairwise form of
+    Welford's algorithm, so chunks can be added in any order and accumulators
+    filled by other threads or processes (they can be pickled) can be merged::
+
+        accumulator = StatsAccumulator(relative_accuracy=0.01)
+        for chunk in iter_chunks(dataset):
+            accumulator.add(chunk)
+        stats = accumulator.result(tag='x')
+
+    Parameters
+    ==========
+    relative_accuracy : float or None
+        None keeps every chunk (without copying it) so the median is exact, and
+        memory grows with the data.
+        Otherwise the median comes from a DDSketch-like histogram of logarithmic
+        buckets and is within this relative error of a value of the data, using
+        memory that grows with the logarithm of the value range only.
+        Non-finite values are not counted in the sketch.
     '''
-    x_pdf = bin_edges[1:]
-    y_cdf = hist.cumsum() / hist.cumsum().max()  # Normalise the cumulative sum
 
-    def cdf_fn(x, shape, scale):
-        return scipy_stats.lognorm.cdf(x, shape, loc=0, scale=scale)
-        
-    (shape_out, scale_out), pcov = scipy_curve_fit(cdf_fn, x_pdf, y_cdf)
+    def __init__(self, relative_accuracy=None):
+        self.relative_accuracy = relative_accuracy
+        self.N = 0
+        self.mean = 0.0
+        self.M2 = 0.0
+        self.sum = 0
+        self.high_value = -numpy.inf
+        self.low_value = numpy.inf
+
+        self._chunks = []
+        if relative_accuracy is not None:
+            if not 0 < relative_accuracy < 1:
+                raise ValueError('relative_accuracy has to be between 0 and 1.', relative_accuracy)
+            self._log_gamma = numpy.log((1 + relative_accuracy) / (1 - relative_accuracy))
+            self._positive = defaultdict(int)
+            self._negative = defaultdict(int)
+            self._zeros = 0
+
+    def add(self, values):
+        '''
+        Adds a chunk of values and returns the accumulator.
+        '''
+        values = numpy.asarray(values).ravel()
+        if values.size < 1:
+            return self
+
+        chunk_mean = values.mean(dtype='float64')
+        chunk_M2 = numpy.square(values - chunk_mean).sum()
+        self._combine(values.size, chunk_mean, chunk_M2)
+        self.sum = self.sum + values.sum()
+        self.high_value = max(self.high_value, values.max())
+        self.low_value = min(self.low_value, values.min())
+
+        if self.relative_accuracy is None:
+            self._chunks.append(values)
+        else:
+            values = values[numpy.isfinite(values)]
+            self._zeros += int(numpy.count_nonzero(values == 0))
+            for buckets, selected in ((self._positive, values[values > 0]), (self._negative, -values[values < 0])):
+                if selected.size < 1:
+                    continue
+                indices = numpy.ceil(numpy.log(selected) / self._log_gamma).astype('int64')
+                offset = indices.min()
+                counts = numpy.bincount(indices - offset)
+                for index in numpy.flatnonzero(counts):
+                    buckets[int(index + offset)] += int(counts[index])
+        return self
+
+    def merge(self, other):
+        '''
+        Adds the values accumulated by another StatsAccumulator and returns this one.
+        '''
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('Cannot merge accumulators with different relative_accuracy.',
+                             self.relative_accuracy, other.relative_accuracy)
+        if other.N < 1:
+            return self
+
+        self._combine(other.N, other.mean, other.M2)
+        self.sum = self.sum + other.sum
+        self.high_value = max(self.high_value, other.high_value)
+        self.low_value = min(self.low_value, other.low_value)
+
+        if self.relative_accuracy is None:
+            self._chunks.extend(other._chunks)
+        else:
+            self._zeros += other._zeros
+            for buckets, other_buckets in ((self._positive, other._positive), (self._negative, other._negative)):
+                for index, count in other_buckets.items():
+                    buckets[index] += count
+        return self
 
-    y_pdf = scipy_stats.lognorm.pdf(x_pdf, shape_out, loc=0, scale=scale_out)
+    def _combine(self, N, mean, M2):
+        total = self.N + N
+        delta = mean - self.mean
+        self.mean = self.mean + delta * N / total
+        self.M2 = self.M2 + M2 + delta * delta * self.N * N / total
+        self.N = total
 
-    return x_pdf, y_pdf, MeanSTD(scale_out, shape_out)
+    @property
+    def standard_deviation(self):
+        '''The population standard deviation (as numpy.std).'''
+        return numpy.sqrt(self.M2 / self.N)
 
+    def median(self):
+        '''
+        Returns the exact median, or the sketch estimate with relative_accuracy.
+        '''
+        if self.relative_accuracy is None:
+            return numpy.median(numpy.concatenate(self._chunks))
 
-def list_stats(number_iterable, tag=None):
+        # Buckets from the lowest to the highest value: (count, representative value).
+        gamma = numpy.exp(self._log_gamma)
+        buckets = [(self._negative[index], -2 * gamma ** index / (gamma + 1)) for index in sorted(self._negative, reverse=True)]
+        buckets.append((self._zeros, 0.0))
+        buckets.extend((self._positive[index], 2 * gamma ** index / (gamma + 1)) for index in sorted(self._positive))
+
+        rank = (sum(count for count, _ in buckets) - 1) / 2.0
+        seen = 0
+        for count, value in buckets:
+            seen += count
+            if seen > rank:
+                return value
+        return numpy.nan
+
+    def result(self, tag=None):
+        '''
+        Returns the accumulated statistics.
+
+        Returns
+        =======
+        tuple_of_stats : ListStats namedtuple
+        '''
+        if self.N < 1:
+            raise ValueError('No values have been added to the accumulator.')
+
+        drange = self.high_value - self.low_value
+        return ListStats(self.mean, self.high_value, self.low_value, drange, drange/float(self.mean),
+                         self.standard_deviation, self.median(), self.N, self.sum, tag)
+
+
+def list_stats(number_iterable, tag=None, relative_accuracy=None, chunk_size=None):
     '''
     Evaluates a number of statistics for a list of numerical values.
 
@@ -53,37 +381,27 @@ def list_stats(number_iterable, tag=None):
     ==========
 
     number_iterable : any object that can be turned into a numpy.array
-                      numpy.array(number_iterable)
+                      numpy.asarray(number_iterable), or an h5py dataset,
+                      which is read chunk_size values at a time.
     tag: str
          Optional information to include in the return object.
+    relative_accuracy : float or None
+         The accuracy of the median, see StatsAccumulator.
 
     Returns
     =======
 
     tuple_of_stats : ListStats namedtuple
     '''
-    
-    values = numpy.array(number_iterable)
-    
-    try:
-        mean = values.mean()
-    except Exception as e:
-        mylog.info('Error evaluating mean for: {}'.format(number_iterable))
-        raise e
-        
+    accumulator = StatsAccumulator(relative_accuracy)
+
     try:
-        hv = values.max()
-    except ValueError as e:
-        mylog.info('Error evaluating max for: {}'.format(number_iterable))
-        raise e
+        if is_h5py_dataset(number_iterable):
+            for chunk in iter_chunks(number_iterable, chunk_size):
+                accumulator.add(chunk)
+        else:
+            accumulator.add(number_iterable)
+        return accumulator.result(tag)
     except Exception as e:
+        mylog.info('Error evaluating stats for: {}'.format(number_iterable))
         raise e
-        
-    lv = values.min()
-    drange = hv - lv
-    
-    return ListStats(mean, hv, lv, drange, drange/float(mean), numpy.std(values),
-                     numpy.median(values), values.size, values.sum(), tag)
-
-
-
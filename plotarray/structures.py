@@ -2,17 +2,49 @@
 Module that holds various data structures.
 '''
 
-__all__ = ['ListStats', 'MeanSTD', 'colour_dic', 'colours']
+__all__ = ['ListStats', 'MeanSTD', 'LognormalFit', 'RenderResult', 'PhaseRecord', 'RenderPlan', 'AxisPlan', 'FrozenDict',
+           'colour_dic', 'colours']
 
 from . external import *
-mylog = setup_custom_logger(__name__)
-mylog.debug('Entering {0}'.format(__name__))
+mylog = LazyLogger(__name__)
 
 ListStats = namedtuple('ListStats', ['mean', 'high_value', 'low_value', 'range',
                                      'range_over_mean', 'standard_deviation', 'median', 'N', 'sum', 'tag'])
 
 MeanSTD = namedtuple('MeanSTD', ['mean', 'standard_deviation'])
 
+LognormalFit = namedtuple('LognormalFit', ['x_pdf', 'y_pdf', 'stats', 'converged', 'iterations', 'cost'])
+
+RenderResult = namedtuple('RenderResult', ['index', 'filename', 'error', 'seconds', 'peak_memory'])
+
+PhaseRecord = namedtuple('PhaseRecord', ['phase', 'panel', 'series', 'wall_seconds', 'cpu_seconds', 'peak_memory', 'points'])
+
+RenderPlan = namedtuple('RenderPlan', ['shape', 'figsize', 'title', 'topspace', 'dpi', 'axes', 'series_axes'])
+
+AxisPlan = namedtuple('AxisPlan', ['key', 'type', 'defaults', 'lines', 'xticklabels', 'xticklabel_rotation', 'mpl'])
+
+
+class FrozenDict(Mapping):
+    '''
+    An immutable dictionary that, unlike types.MappingProxyType, can be pickled.
+    '''
+    __slots__ = ('_dict',)
+
+    def __init__(self, *args, **kwargs):
+        self._dict = dict(*args, **kwargs)
+
+    def __getitem__(self, key):
+        return self._dict[key]
+
+    def __iter__(self):
+        return iter(self._dict)
+
+    def __len__(self):
+        return len(self._dict)
+
+    def __repr__(self):
+        return 'FrozenDict({!r})'.format(self._dict)
+
 
 colour_dic = OrderedDict(webcolors.css3_names_to_hex)
 colour_dic.update(OrderedDict([('red', '#900000'),
@@ -30,5 +62,11 @@ colour_dic.update(OrderedDict([('red', '#900000'),
 
 colour_name_cycle = itertools.cycle(colour_dic)
 
-_TC = namedtuple('TemporaryContainer', colour_dic.keys())
-colours = _TC(*colour_dic.values())
+def __getattr__(name):
+    # colours is a namedtuple class with one field per colour, which is slow to build,
+    # so it is only created the first time it is used.
+    if name == 'colours':
+        _TC = namedtuple('TemporaryContainer', colour_dic.keys())
+        globals()['colours'] = _TC(*colour_dic.values())
+        return globals()['colours']
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
@@ -0,0 +1,31 @@
+import os
+
+import numpy
+
+from plotarray import render_batch
+
+def test_render_batch(tmpdir):
+
+    plot_info = {'shape':(1,1),
+                 'figsize':(4,4),
+                 'title':'Batch test',
+                 ((0,0),1,1):dict(mpl=dict(title='Scatter'),
+                                  series=dict(TEST='green'),
+                                  type='scatter',
+                          ),
+             }
+
+    jobs = []
+    for index in range(4):
+        plot_data = dict(TEST=dict(x=numpy.arange(10.0), y=numpy.arange(10.0) * index))
+        jobs.append((plot_data, plot_info, str(tmpdir.join('batch_{}.png'.format(index)))))
+    bad_plot_info = dict(plot_info)
+    bad_plot_info[((0,0),1,1)] = dict(plot_info[((0,0),1,1)], series=dict(TEST='not_a_colour'))
+    jobs.append((plot_data, bad_plot_info, str(tmpdir.join('batch_error.png'))))
+
+    results = render_batch(jobs, processes=2, max_memory=1000)
+
+    assert [result.index for result in results] == list(range(5))
+    assert all(result.error is None for result in results[:4])
+    assert all(os.path.exists(result.filename) for result in results[:4])
+    assert results[4].error is not None
@@ -0,0 +1,69 @@
+import os
+
+import numpy
+
+from plotarray import render_plot_array, compile_plot_info, PanelCache, retrieve_plot_data, save_plot_data
+from plotarray import PlotDataWriter
+from plotarray.cache import panel_digest
+
+def test_panel_cache(tmpdir):
+
+    plot_info = {'shape':(1,2),
+                 'figsize':(6,3),
+                 'title':'Panel cache test',
+                 'topspace':0.9,
+                 ((0,0),1,1):dict(mpl=dict(title='A'), series=dict(A='green'), type='scatter'),
+                 ((0,1),1,1):dict(mpl=dict(title='B'), series=dict(B='red'), type='histogram'),
+             }
+    plan = compile_plot_info(plot_info)
+    random_state = numpy.random.RandomState(0)
+    plot_data = dict(A=dict(x=random_state.randn(100), y=random_state.randn(100)),
+                     B=dict(x=random_state.randn(100), y=random_state.randn(100)))
+
+    cache = PanelCache(str(tmpdir.join('panels')))
+    first = render_plot_array(plot_data, plan, format='rgba', panel_cache=cache)
+    assert first.shape == (300, 600, 4)
+    assert len(os.listdir(cache.directory)) == 2
+    numpy.testing.assert_array_equal(render_plot_array(plot_data, plan, format='rgba', panel_cache=cache), first)
+
+    plot_data['B'] = dict(x=random_state.randn(100), y=random_state.randn(100))
+    second = render_plot_array(plot_data, plan, format='rgba', panel_cache=cache)
+    assert len(os.listdir(cache.directory)) == 3
+    numpy.testing.assert_array_equal(second[:, :300], first[:, :300])
+
+    cache.max_bytes = first[:, :300].nbytes * 2
+    cache.evict()
+    assert len(os.listdir(cache.directory)) == 2
+    cache.max_bytes = 2**30
+
+    # Functions are keyed by name; a lambda has no stable key, so its panel is not cached.
+    for function, N_files in ((numpy.abs, 3), (lambda x: abs(x), 3)):
+        plot_info[((0,1),1,1)]['function'] = function
+        plan = compile_plot_info(plot_info)
+        render_plot_array(plot_data, plan, format='rgba', panel_cache=cache)
+        assert len(os.listdir(cache.directory)) == N_files
+    assert panel_digest(plan.axes[((0,1),1,1)], plot_data, (300, 270), 100) is None
+    del plot_info[((0,1),1,1)]['function']
+
+    # Lazily retrieved series are keyed on their file, name, shape and version.
+    cache.clear()
+    plan = compile_plot_info(plot_info)
+    filename = str(tmpdir.join('panel_cache_test.h5'))
+    with PlotDataWriter(filename, 'w') as writer:
+        writer.update(plot_data)
+    for N_files, new_points in ((2, 0), (2, 0), (3, 10)):
+        if new_points:
+            with PlotDataWriter(filename) as writer:
+                writer.append_series('B', dict(x=numpy.ones(new_points), y=numpy.ones(new_points)))
+        with retrieve_plot_data(filename, lazy=True) as lazy_data:
+            render_plot_array(lazy_data, plan, format='rgba', panel_cache=cache)
+        assert len(os.listdir(cache.directory)) == N_files
+
+    # A file rewritten with the same shapes but other values in the middle is drawn again.
+    plot_data = dict(A=dict(x=numpy.arange(100000.0), y=numpy.zeros(100000)), B=plot_data['B'])
+    for N_files in (4, 5):
+        save_plot_data(plot_data, filename, chunks=(1000,))
+        with retrieve_plot_data(filename, lazy=True) as lazy_data:
+            render_plot_array(lazy_data, plan, format='rgba', panel_cache=cache)
+        assert len(os.listdir(cache.directory)) == N_files
+        plot_data['A']['y'][40000:60000] = 1.0
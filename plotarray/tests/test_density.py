@@ -0,0 +1,32 @@
+import warnings
+
+import numpy
+
+from plotarray import save_plot_data, retrieve_plot_data, render_plot_array
+
+def test_density(tmpdir):
+
+    filename = str(tmpdir.join('density_test.h5'))
+    random_state = numpy.random.RandomState(0)
+    save_plot_data(dict(TEST=dict(x=random_state.randn(20000), y=random_state.randn(20000)),
+                        SAME=dict(x=numpy.ones(100), y=numpy.ones(100))), filename, chunks=(1000,))
+
+    for options in (dict(), dict(log=True, colourbar=True), dict(xlim=(-1, 1)), dict(ylim=(0, 3), N_bins=50)):
+        mpl = dict(title='Density')
+        mpl.update((key, options.pop(key)) for key in ('xlim', 'ylim') if key in options)
+        plot_info = {'shape':(1,1),
+                     'figsize':(4,3),
+                     'title':'Density test',
+                     ((0,0),1,1):dict(mpl=mpl, series=dict(TEST='blue'), type='density', chunk_size=1000, **options),
+                 }
+
+        in_memory = render_plot_array(retrieve_plot_data(filename), plot_info, format='rgba')
+        with retrieve_plot_data(filename, lazy=True) as lazy_data:
+            numpy.testing.assert_array_equal(render_plot_array(lazy_data, plot_info, format='rgba'), in_memory)
+
+    # All points equal: the range is widened instead of giving the image no width.
+    plot_info[((0,0),1,1)]['series'] = dict(SAME='blue')
+    del plot_info[((0,0),1,1)]['mpl']['ylim']
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        render_plot_array(retrieve_plot_data(filename), plot_info, format='rgba')
@@ -0,0 +1,169 @@
+import os
+
+import numpy
+import pytest
+
+from plotarray import save_plot_data, retrieve_plot_data, append_plot_data, PlotDataWriter
+from plotarray.hdf5 import read_matrix_level
+
+def test_lazy_retrieve(tmpdir):
+
+    filename = str(tmpdir.join('lazy_test.h5'))
+    plot_data = dict(TEST=dict(x=numpy.arange(100, dtype=float), y=numpy.arange(100)))
+    save_plot_data(plot_data, filename)
+
+    with retrieve_plot_data(filename, lazy=True) as lazy_data:
+        assert list(lazy_data) == ['TEST']
+        assert len(lazy_data['TEST']['x']) == 100
+        numpy.testing.assert_array_equal(lazy_data['TEST']['x'][10:20], plot_data['TEST']['x'][10:20])
+        numpy.testing.assert_array_equal(lazy_data['TEST'].read('y'), plot_data['TEST']['y'])
+
+    assert not lazy_data._h5_file
+
+def test_compressed_save(tmpdir):
+
+    filename = str(tmpdir.join('compressed_test.h5'))
+    plot_data = dict(TEST=dict(x=numpy.zeros(10000), y=list(range(10000)), labels=['a', 'bcd']),
+                     RAW=dict(x=numpy.ones(10)))
+    save_plot_data(plot_data, filename, chunks=True, compression='gzip', shuffle=True,
+                   series_options={'RAW': dict(chunks=None, compression=None, shuffle=False)})
+
+    with retrieve_plot_data(filename, lazy=True) as lazy_data:
+        assert lazy_data['TEST']['x'].compression == 'gzip'
+        assert lazy_data['TEST']['y'].dtype == numpy.int64
+        assert lazy_data['RAW']['x'].compression is None
+        assert list(lazy_data['TEST']['labels'][()]) == [b'a', b'bcd']
+
+    # One chunk shape for series of any length and rank.
+    plot_data['MATRIX'] = dict(matrix=numpy.ones((30, 40)))
+    save_plot_data(plot_data, filename, chunks=(65536,))
+    with retrieve_plot_data(filename, lazy=True) as lazy_data:
+        assert lazy_data['TEST']['x'].chunks == (10000,) and lazy_data['RAW']['x'].chunks == (10,)
+        assert lazy_data['MATRIX']['matrix'].chunks == (30, 40)
+    save_plot_data(plot_data, filename, chunks=(8, 8, 8))
+    with retrieve_plot_data(filename, lazy=True) as lazy_data:
+        assert lazy_data['TEST']['x'].chunks == (8,) and lazy_data['MATRIX']['matrix'].chunks == (8, 8)
+
+def test_append(tmpdir):
+
+    filename = str(tmpdir.join('append_test.h5'))
+
+    with PlotDataWriter(filename) as writer:
+        for start in range(0, 1000, 100):
+            writer.append('TEST', 'x', numpy.arange(start, start + 100, dtype=float))
+    append_plot_data(dict(TEST=dict(x=[1000.0]), NEW=dict(y=[1, 2])), filename)
+
+    plot_data = retrieve_plot_data(filename)
+    numpy.testing.assert_array_equal(plot_data['TEST']['x'], numpy.arange(1001, dtype=float))
+    numpy.testing.assert_array_equal(plot_data['NEW']['y'], [1, 2])
+
+    with pytest.raises(ValueError):
+        append_plot_data(dict(NEW=dict(y=[2.7, 3.9])), filename)
+
+def test_matrix_pyramid(tmpdir):
+
+    filename = str(tmpdir.join('pyramid_test.h5'))
+    matrix = numpy.random.RandomState(0).randn(300, 200)
+    save_plot_data(dict(TEST=dict(matrix=matrix)), filename, pyramid=32)
+
+    with retrieve_plot_data(filename, lazy=True) as lazy_data:
+        factor, max_abs, mean = read_matrix_level(lazy_data['TEST'], 'matrix', (40, 40))
+        assert factor == 8 and mean.shape == (38, 25)
+        assert max_abs.max() == numpy.abs(matrix).max()
+        numpy.testing.assert_allclose(mean[0, 0], matrix[:8, :8].mean())
+        numpy.testing.assert_allclose(mean[-1, -1], matrix[296:, 192:].mean())
+
+    assert 'matrix_pyramid' not in retrieve_plot_data(filename)['TEST']
+
+def test_derived_results(tmpdir):
+
+    from plotarray.hdf5 import derived_result
+
+    filename = str(tmpdir.join('derived_test.h5'))
+    append_plot_data(dict(TEST=dict(x=numpy.arange(10, dtype=float))), filename)
+
+    calls = []
+    def total(plot_dic):
+        calls.append(1)
+        return (plot_dic['x'][()].sum(),)
+
+    for i in range(2):
+        with retrieve_plot_data(filename, lazy=True, cache_derived=True) as lazy_data:
+            assert derived_result(lazy_data['TEST'], 'sum', (), ('x',), lambda: total(lazy_data['TEST'])) == (45,)
+            assert list(lazy_data['TEST']) == ['x']
+    assert len(calls) == 1
+
+    append_plot_data(dict(TEST=dict(x=[10.0])), filename)
+    with retrieve_plot_data(filename, lazy=True, cache_derived=True) as lazy_data:
+        assert derived_result(lazy_data['TEST'], 'sum', (), ('x',), lambda: total(lazy_data['TEST'])) == (55,)
+    assert len(calls) == 2
+
+    assert list(retrieve_plot_data(filename)['TEST']) == ['x']
+
+def test_plot_data_container(tmpdir):
+
+    from plotarray import PlotData, make_plot_array
+
+    x = numpy.array([1.0, 2.0, float('-inf'), 4.0])
+    plot_data = PlotData(dict(TEST=dict(x=x, y=[1, 2, 3, 4], labels=['a', 'b', 'c', 'd'], scale=2.5)))
+
+    series = plot_data['TEST']
+    assert series.length == 4 and series['y'].dtype.kind == 'i' and series['scale'].shape == ()
+    assert numpy.shares_memory(series['x'], x)
+    assert not series['x'].flags.writeable and x.flags.writeable
+    assert plot_data.nbytes == sum(series[data_key].nbytes for data_key in series)
+
+    with pytest.raises(ValueError):
+        PlotData(dict(BAD=dict(x=[1.0, 2.0], y=[1.0])))
+
+    plot_info = {'shape':(1,1), 'figsize':(4,4), 'title':'PlotData test',
+                 ((0,0),1,1):dict(mpl=dict(title='Scatter'), series=dict(TEST='green'), type='scatter',
+                                  trendline=dict(TEST=True))}
+    make_plot_array(plot_data, plot_info, str(tmpdir.join('plot_data_test.png')))
+    assert x[2] == float('-inf')
+
+    filename = str(tmpdir.join('plot_data_test.h5'))
+    plot_data.save(filename, compression='gzip')
+    loaded = PlotData.load(filename)
+    numpy.testing.assert_array_equal(loaded['TEST']['x'], x)
+    assert list(loaded['TEST']['labels']) == [b'a', b'b', b'c', b'd']
+
+def test_retrieve_files(tmpdir):
+
+    from plotarray import retrieve_plot_data_files, make_plot_array
+
+    filenames = []
+    for index in range(3):
+        filenames.append(str(tmpdir.join('run_{}.h5'.format(index))))
+        save_plot_data(dict(A=dict(x=numpy.arange(10.0) + index, y=numpy.arange(10.0), labels=['a']),
+                            B=dict(x=numpy.ones(5))), filenames[-1])
+
+    plot_data = retrieve_plot_data_files(filenames + [str(tmpdir.join('missing.h5'))], max_workers=2)
+    assert list(plot_data) == ['run_0:A', 'run_0:B', 'run_1:A', 'run_1:B', 'run_2:A', 'run_2:B']
+    numpy.testing.assert_array_equal(plot_data['run_2:A']['x'], numpy.arange(10.0) + 2)
+
+    plot_info = {'shape':(1,1), 'figsize':(4,4), 'title':'Files test',
+                 ((0,0),1,1):dict(mpl=dict(title='Histogram'), series={'first:A':'red', 'last:B':'blue'},
+                                  type='histogram')}
+    plot_data = retrieve_plot_data_files(dict(first=filenames[0], last=filenames[2]), plot_info=plot_info)
+    assert {series_key: sorted(series_dic) for series_key, series_dic in plot_data.items()} == \
+           {'first:A': ['x'], 'last:B': ['x']}
+    make_plot_array(plot_data, plot_info, str(tmpdir.join('files_test.png')))
+
+def test_column_directory(tmpdir):
+
+    directory = str(tmpdir.join('columns_test'))
+    matrix = numpy.arange(12.0).reshape(3, 4)
+    plot_data = dict(TEST=dict(x=numpy.arange(1000.0), y=numpy.arange(1000), labels=['a', 'bcd'], empty=[], scale=2.5),
+                     MATRIX=dict(matrix=matrix))
+    save_plot_data(plot_data, directory, backend='columns')
+    save_plot_data(plot_data, directory, backend='columns')
+    assert len(os.listdir(directory)) == 7
+
+    with retrieve_plot_data(directory) as mapped:
+        assert isinstance(mapped['TEST']['x'], numpy.memmap)
+        assert not mapped['TEST']['x'].flags.writeable
+        numpy.testing.assert_array_equal(mapped['TEST']['y'], plot_data['TEST']['y'])
+        numpy.testing.assert_array_equal(mapped['MATRIX']['matrix'], matrix)
+        assert list(mapped['TEST']['labels']) == [b'a', b'bcd'] and mapped['TEST']['empty'].size == 0
+        assert mapped['TEST']['scale'].shape == () and mapped['TEST']['scale'] == 2.5
@@ -2,7 +2,7 @@ import numpy
 
 from plotarray import make_plot_array
 
-def test_hinton():
+def test_hinton(tmpdir):
 
     plot_data = dict(TEST=dict(matrix=numpy.array([[1,2,3], [4,5,6], [7,8,9]])))
 
@@ -14,9 +14,20 @@ def test_hinton():
                                            xlabel='Column',
                                            ylabel='Row',
                                        ),
-                                  series=dict(TEST='green')
+                                  series=dict(TEST='green'),
                                   type='hinton',
                           ),
              }
 
-    make_plot_array(plot_data, plot_info, 'hinton_test_A.pdf')   
\ No newline at end of file
+    make_plot_array(plot_data, plot_info, str(tmpdir.join('hinton_test_A.pdf')))
+
+def test_matplotlib_set_up_once():
+
+    import matplotlib
+    from plotarray.external import plt, _setup_matplotlib
+
+    plt.figure
+    with matplotlib.rc_context({'font.family': 'serif'}):
+        # Runs for every lazily imported matplotlib module, e.g. the first hinton plot.
+        _setup_matplotlib()
+        assert matplotlib.rcParams['font.family'] == ['serif']
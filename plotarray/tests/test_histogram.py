@@ -0,0 +1,52 @@
+import numpy
+
+from plotarray import save_plot_data, retrieve_plot_data, render_plot_array
+
+def test_chunked_histogram_matches_in_memory(tmpdir):
+
+    filename = str(tmpdir.join('histogram_test.h5'))
+    random_state = numpy.random.RandomState(0)
+    save_plot_data(dict(TEST=dict(x=random_state.lognormal(1, 0.5, 20000))), filename, chunks=(1000,))
+
+    plot_info = {'shape':(1,1),
+                 'figsize':(4,3),
+                 'title':'Chunked histogram test',
+                 ((0,0),1,1):dict(mpl=dict(title='Histogram', xlim=(-1, 2.5)),
+                                  series=dict(TEST='red'),
+                                  type='histogram',
+                                  function=numpy.log,
+                                  lognormal_fit=True,
+                                  chunk_size=1000,
+                          ),
+             }
+
+    in_memory = render_plot_array(retrieve_plot_data(filename), plot_info, format='rgba')
+    with retrieve_plot_data(filename, lazy=True) as lazy_data:
+        chunked = render_plot_array(lazy_data, plot_info, format='rgba')
+
+    numpy.testing.assert_array_equal(chunked, in_memory)
+
+def test_prebinned_histogram(tmpdir):
+
+    from plotarray import make_plot_array
+    from plotarray.core import _bin_histogram
+
+    random_state = numpy.random.RandomState(0)
+    counts, bin_edges = numpy.histogram(random_state.uniform(0, 10, 1000), 20, range=(0, 10))
+    plot_dic = dict(counts=counts, bin_edges=bin_edges)
+
+    # xlim keeps the bins that lie completely inside it.
+    hist, edges, mean, lowest, highest = _bin_histogram(plot_dic, dict(xlim=(1.9, 6.2)))
+    numpy.testing.assert_array_equal(hist, counts[4:12])
+    numpy.testing.assert_array_equal(edges, bin_edges[4:13])
+    assert (lowest, highest) == (2.0, 6.0) and 2.0 < mean < 6.0
+    assert _bin_histogram(plot_dic, dict(xlim=(2.1, 2.4))) is None
+
+    plot_info = {'shape':(1,2),
+                 'figsize':(6,3),
+                 'title':'Pre-binned histogram test',
+                 ((0,0),1,1):dict(mpl=dict(title='All'), series=dict(TEST='red', BAD='blue'), type='histogram'),
+                 ((0,1),1,1):dict(mpl=dict(title='xlim', xlim=(1.9, 6.2)), series=dict(TEST='red'), type='histogram'),
+             }
+    make_plot_array(dict(TEST=plot_dic, BAD=dict(counts=counts, bin_edges=bin_edges[:-1])), plot_info,
+                    str(tmpdir.join('prebinned_test.png')))
@@ -0,0 +1,32 @@
+import re
+
+import numpy
+
+from plotarray import make_plot_pages, clear_figure_templates
+
+def test_make_plot_pages(tmpdir):
+
+    plot_infos = []
+    for title in ('First', 'Second', 'Third'):
+        plot_infos.append({'shape':(1,1),
+                           'figsize':(4,4),
+                           'title':title,
+                           ((0,0),1,1):dict(mpl=dict(title=title), series=dict(TEST='green'), type='scatter'),
+                       })
+    plot_data = dict(TEST=dict(x=numpy.arange(10.0), y=numpy.arange(10.0)))
+
+    filename = str(tmpdir.join('pages_shared.pdf'))
+    assert make_plot_pages(plot_data, plot_infos, filename, metadata=dict(Title='Pages test')) == 3
+
+    page_data = [dict(TEST=dict(x=numpy.arange(10.0), y=numpy.arange(10.0) * index)) for index in range(2)]
+    filename_list = str(tmpdir.join('pages_list.pdf'))
+    try:
+        assert make_plot_pages(page_data, plot_infos, filename_list, reuse_figure=True) == 2
+    finally:
+        clear_figure_templates()
+
+    for filename, N_pages in ((filename, 3), (filename_list, 2)):
+        with open(filename, 'rb') as pdf_file:
+            pdf = pdf_file.read()
+        assert pdf.startswith(b'%PDF') and pdf.count(b'%%EOF') == 1
+        assert len(re.findall(rb'/Type\s*/Page\b', pdf)) == N_pages
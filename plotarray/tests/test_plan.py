@@ -0,0 +1,108 @@
+import copy
+import pickle
+
+import numpy
+
+from plotarray import compile_plot_info, make_plot_array
+
+def test_compiled_plan_is_reusable(tmpdir):
+
+    plot_info = {'shape':(1,2),
+                 'figsize':(8,4),
+                 'title':'Plan test',
+                 ((0,0),1,1):dict(mpl=dict(title='Scatter',
+                                           axvlines=[dict(x=1, color='red')],
+                                           xticks=[0, 1, 2],
+                                           xticklabels=['a', 'b', 'c'],
+                                           rotate_xticklabels=45),
+                                  series=dict(A='green', B='blue'),
+                                  type='scatter',
+                                  alpha=dict(A=0.5),
+                          ),
+                 ((0,1),1,1):dict(mpl=dict(title='Histogram'),
+                                  series=dict(B='red'),
+                                  type='histogram',
+                          ),
+             }
+    original = copy.deepcopy(plot_info)
+
+    plan = compile_plot_info(plot_info)
+    assert plan.series_axes['B'] == (((0,0),1,1), ((0,1),1,1))
+    assert plan.axes[((0,0),1,1)].defaults['A']['alpha'] == 0.5
+    assert pickle.loads(pickle.dumps(plan)) == plan
+
+    for index in range(2):
+        plot_data = dict(A=dict(x=numpy.arange(3.0), y=numpy.arange(3.0) * index),
+                         B=dict(x=numpy.arange(30.0), y=numpy.arange(30.0)))
+        make_plot_array(plot_data, plan, str(tmpdir.join('plan_{}.png'.format(index))))
+    make_plot_array(plot_data, plot_info, str(tmpdir.join('plan_info.png')))
+
+    assert plot_info == original
+
+def test_reused_figure_matches_new_figure():
+
+    from plotarray import render_plot_array, clear_figure_templates
+
+    plot_info = {'shape':(1,2),
+                 'figsize':(6,3),
+                 'title':'Reuse test',
+                 ((0,0),1,1):dict(mpl=dict(title='Scatter'), series=dict(A='green'), type='scatter'),
+                 ((0,1),1,1):dict(mpl=dict(title='Histogram'), series=dict(A='red'), type='histogram'),
+             }
+    plan = compile_plot_info(plot_info)
+    random_state = numpy.random.RandomState(0)
+
+    try:
+        for i in range(3):
+            plot_data = dict(A=dict(x=random_state.randn(100), y=random_state.randn(100)))
+            reused = render_plot_array(plot_data, plan, format='rgba', reuse_figure=True)
+            numpy.testing.assert_array_equal(reused, render_plot_array(plot_data, plan, format='rgba'))
+    finally:
+        clear_figure_templates()
+
+def test_render_report(tmpdir):
+
+    from plotarray import RenderReport
+
+    plot_info = {'shape':(1,2),
+                 'figsize':(6,3),
+                 'title':'Report test',
+                 ((0,0),1,1):dict(mpl=dict(title='Scatter'), series=dict(A='green', B='blue'), type='scatter'),
+                 ((0,1),1,1):dict(mpl=dict(title='Histogram'), series=dict(A='red'), type='histogram'),
+             }
+    plot_data = dict(A=dict(x=numpy.arange(100.0), y=numpy.arange(100.0)),
+                     B=dict(x=numpy.arange(10.0), y=numpy.arange(10.0)))
+
+    phases = []
+    report = RenderReport(callback=lambda record: phases.append(record.phase))
+    make_plot_array(plot_data, plot_info, str(tmpdir.join('report_test.png')), report=report)
+
+    summary = report.summary()
+    assert list(summary) == ['defaults', 'figure', 'draw', 'layout', 'savefig']
+    assert summary['draw']['count'] == 3 and summary['draw']['points'] == 210
+    assert phases == [record.phase for record in report.records]
+    assert all(record.wall_seconds >= 0 for record in report.records)
+
+    # The peak memory is measured per phase, not for the process.
+    from plotarray import save_plot_data, retrieve_plot_data
+    filename = str(tmpdir.join('report_test.h5'))
+    save_plot_data(dict(BIG=dict(x=numpy.zeros(10**6)), SMALL=dict(x=numpy.zeros(10))), filename)
+    report = RenderReport(trace_memory=True)
+    retrieve_plot_data(filename, report=report)
+    peak_memory = {record.series: record.peak_memory for record in report.records}
+    assert peak_memory['BIG'] >= 8 * 10**6 and peak_memory['SMALL'] < 10**5
+
+    report = RenderReport()
+    retrieve_plot_data(filename, report=report)
+    assert [record.peak_memory for record in report.records] == [None, None]
+
+def test_subplot_without_mpl(tmpdir, capsys):
+
+    plot_info = {'shape':(1,1),
+                 'figsize':(4,4),
+                 'title':'No mpl test',
+                 ((0,0),1,1):dict(series=dict(A='green'), type='scatter'),
+             }
+    make_plot_array(dict(A=dict(x=numpy.arange(3.0), y=numpy.arange(3.0))), plot_info,
+                    str(tmpdir.join('no_mpl_test.png')))
+    assert capsys.readouterr().out == ''
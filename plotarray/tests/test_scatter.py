@@ -0,0 +1,30 @@
+import numpy
+
+from plotarray import render_plot_array
+
+def test_decimated_scatter_matches_full(tmpdir):
+
+    random_state = numpy.random.RandomState(0)
+    plot_data = dict(A=dict(x=10 ** random_state.uniform(-3, 3, 50000), y=random_state.randn(50000)))
+
+    def painted(rgba):
+        return (rgba[..., :3] < 255).any(axis=-1)
+
+    for scale in ('linear', 'log'):
+        for alpha in (1.0, None):
+            plot_info = {'shape':(1,1),
+                         'figsize':(4,3),
+                         'title':'Decimation test',
+                         'dpi':100,
+                         ((0,0),1,1):dict(mpl=dict(xscale=scale), series=dict(A='blue'), type='scatter'),
+                     }
+            if alpha:
+                plot_info[((0,0),1,1)]['alpha'] = alpha
+            full = render_plot_array(plot_data, plot_info, format='rgba')
+            plot_info[((0,0),1,1)]['decimate'] = True
+            decimated = render_plot_array(plot_data, plot_info, format='rgba')
+
+            # Opaque markers look the same; with the default alpha the same pixels are covered.
+            if alpha:
+                assert (full != decimated).any(axis=-1).mean() < 0.05, scale
+            assert (painted(full) != painted(decimated)).mean() < 0.01, (scale, alpha)
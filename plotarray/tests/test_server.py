@@ -0,0 +1,35 @@
+import threading
+
+import numpy
+import pytest
+
+from plotarray import save_plot_data
+from plotarray.server import RenderServer, RenderClient
+
+def test_render_server(tmpdir):
+
+    plot_info = {'shape':(1,1),
+                 'figsize':(4,4),
+                 'title':'Server test',
+                 ((0,0),1,1):dict(mpl=dict(title='Scatter'), series=dict(TEST='green'), type='scatter'),
+             }
+    plot_data = dict(TEST=dict(x=numpy.arange(10.0), y=numpy.arange(10.0)))
+    filename = str(tmpdir.join('server_test.h5'))
+    save_plot_data(plot_data, filename)
+
+    with pytest.raises(ValueError):
+        RenderServer(('localhost', 0))
+
+    with RenderServer(str(tmpdir.join('server.sock'))) as server:
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        with RenderClient(server.address) as client:
+            results = [client.render(plot_data, plot_info, str(tmpdir.join('server_dict.png'))),
+                       client.render(filename, plot_info, str(tmpdir.join('server_file.png'))),
+                       client.render(str(tmpdir.join('missing.h5')), plot_info, str(tmpdir.join('missing.png')))]
+
+    assert results[0].error is None and results[1].error is None
+    assert tmpdir.join('server_dict.png').check() and tmpdir.join('server_file.png').check()
+    assert 'FileNotFoundError' in results[2].error
@@ -0,0 +1,56 @@
+import pickle
+
+import numpy
+
+from plotarray.stats import list_stats, StatsAccumulator
+
+def test_accumulator_matches_list_stats():
+
+    values = numpy.random.RandomState(0).lognormal(0, 1, 10000)
+    stats = list_stats(values, tag='all')
+    assert stats.N == 10000 and stats.tag == 'all'
+    numpy.testing.assert_allclose(stats.standard_deviation, numpy.std(values))
+    assert stats.median == numpy.median(values)
+
+    halves = [StatsAccumulator(relative_accuracy=0.01) for i in range(2)]
+    for accumulator, chunk in zip(halves, numpy.array_split(values, 2)):
+        for part in numpy.array_split(chunk, 7):
+            accumulator.add(part)
+    merged = pickle.loads(pickle.dumps(halves[0])).merge(halves[1]).result()
+
+    numpy.testing.assert_allclose(merged.mean, stats.mean)
+    numpy.testing.assert_allclose(merged.standard_deviation, stats.standard_deviation)
+    assert (merged.high_value, merged.low_value, merged.N) == (stats.high_value, stats.low_value, stats.N)
+    assert abs(merged.median / stats.median - 1) <= 0.02
+
+def test_batched_lognormal_fit():
+
+    from plotarray.stats import fit_lognormal_to_histograms
+
+    random_state = numpy.random.RandomState(0)
+    parameters = [(0.0, 0.5), (2.0, 1.0), (-1.0, 0.25)]
+    binned = [numpy.histogram(random_state.lognormal(mu, sigma, 100000), N_bins)
+              for (mu, sigma), N_bins in zip(parameters, (30, 50, 80))]
+
+    fits = fit_lognormal_to_histograms([hist for hist, _ in binned], [edges for _, edges in binned])
+    for fit, (mu, sigma) in zip(fits, parameters):
+        assert fit.converged
+        numpy.testing.assert_allclose(fit.stats, (numpy.exp(mu), sigma), rtol=0.05)
+
+    # Wide distributions in a few linear bins, which put most values in the first bin.
+    parameters = [(0.0, 1.8), (1.0, 2.0), (-1.0, 1.7)]
+    binned = [numpy.histogram(random_state.lognormal(mu, sigma, 5000), N_bins)
+              for (mu, sigma), N_bins in zip(parameters, (10, 20, 50))]
+    hists, bin_edges = [hist for hist, _ in binned], [edges for _, edges in binned]
+
+    from scipy.optimize import curve_fit
+    from scipy.stats import lognorm
+    for fit, hist, edges in zip(fit_lognormal_to_histograms(hists, bin_edges), hists, bin_edges):
+        y_cdf = hist.cumsum() / hist.sum()
+        (shape, scale), _ = curve_fit(lambda x, shape, scale: lognorm.cdf(x, shape, scale=scale), edges[1:], y_cdf)
+        assert fit.converged
+        assert fit.cost <= ((lognorm.cdf(edges[1:], shape, scale=scale) - y_cdf) ** 2).sum() * (1 + 1e-6)
+
+    # Histograms that do not converge in max_iterations are fitted with curve_fit.
+    fits = fit_lognormal_to_histograms(hists, bin_edges, max_iterations=1)
+    assert all(fit.converged and fit.iterations == 1 for fit in fits)